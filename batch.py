@@ -0,0 +1,124 @@
+"""Headless window and ring reductions over many runs.
+
+    python batch.py --window 0:100 --window 100:200 --ring 50:127 \\
+        --out results run1.info run1.dat run2.info run2.dat
+
+For every info/data pair this writes ``<out>/<data name>_windows.npy`` with
+the (nwindows, nx, ny) window sums, and appends one row per window and
+ring to ``<out>/summary.csv`` with the window total and the ring-masked
+total. With ``--slide WIDTH:STRIDE`` the sums of a window of WIDTH frames
+stepped by STRIDE over the whole run go to ``<data name>_slide.npy``.
+Data files whose names only differ by directory would overwrite each
+other's outputs, so they are refused.
+Only numpy and the mainapplication.utils modules are imported, so
+it runs without a display.
+"""
+import argparse
+import csv
+import multiprocessing
+import os
+import sys
+import numpy as np
+from mainapplication.utils import cube
+from mainapplication.utils import mask
+from mainapplication.utils import parallel
+from mainapplication.utils import playback
+from mainapplication.utils import utils
+from mainapplication.utils import windowindex
+
+
+def parseRange(text):
+    start, end = text.split(':')
+    return utils.num(start), utils.num(end)
+
+
+def parseCenter(text):
+    x, y = text.split(',')
+    return utils.num(x), utils.num(y)
+
+
+def outputName(dataName):
+    """Prefix of the .npy files written for `dataName`."""
+    return os.path.splitext(os.path.basename(dataName))[0]
+
+
+def reduceRun(job):
+    infoName, dataName, windows, rings, center, alghoritmIndex, mmap, slide, threads, outDir = job
+    parallel.workers = threads
+    info = utils.readInfoFile(infoName)
+    shape = (info['nx'], info['ny'], info['nt'])
+    data = cube.loadCube(dataName, shape, mmap=mmap, narrow=not mmap, **cube.cubeFormat(info))
+    if center is None:
+        center = (info['nx']/2-1, info['ny']/2-1)
+    masks = [mask.ringMask(shape[:2], center, ring, alghoritmIndex) for ring in rings]
+
+    sums = np.empty((len(windows),) + shape[:2], dtype=windowindex.accumulatorDtype(data.dtype))
+    rows = []
+    for i, (start, end) in enumerate(windows):
+        sums[i] = cube.windowSum(data, start, end)
+        total = sums[i].sum()
+        for ring, ringMask in zip(rings, masks):
+            rows.append([dataName, start, end, total, ring[0], ring[1], alghoritmIndex,
+                         np.sum(parallel.multiply(sums[i], ringMask))])
+        if not rings:
+            rows.append([dataName, start, end, total, '', '', '', ''])
+
+    name = outputName(dataName)
+    np.save(os.path.join(outDir, name + '_windows.npy'), sums)
+    if slide is not None:
+        playback.exportWindows(data, os.path.join(outDir, name + '_slide.npy'), *slide)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Reduce time windows and rings over many runs.')
+    parser.add_argument('runs', nargs='+', metavar='INFO DATA', help='info/data file pairs')
+    parser.add_argument('--window', action='append', type=parseRange, default=[],
+                        metavar='START:END', help='time window [START, END), repeatable; default whole run')
+    parser.add_argument('--ring', action='append', type=parseRange, default=[],
+                        metavar='INNER:OUTER', help='ring radii, repeatable')
+    parser.add_argument('--center', type=parseCenter, default=None, metavar='X,Y',
+                        help='ring center; default the detector center')
+    parser.add_argument('--aa', action='store_true', help='anti-aliased ring masks')
+    parser.add_argument('--slide', type=parseRange, default=None, metavar='WIDTH:STRIDE',
+                        help='also write the sliding window sums of every step')
+    parser.add_argument('--mmap', action='store_true', help='memory-map data files')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes; default one per CPU')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='threads reducing each run; default 1, as runs already go to one process per CPU')
+    parser.add_argument('--out', default='.', help='output directory')
+    args = parser.parse_args(argv)
+
+    if len(args.runs) % 2:
+        parser.error('runs must be given as INFO DATA pairs')
+    names = {}
+    for dataName in args.runs[1::2]:
+        names.setdefault(outputName(dataName), []).append(dataName)
+    for name, dataNames in sorted(names.items()):
+        if len(dataNames) > 1:
+            parser.error('%s would all write %s_*.npy' % (', '.join(dataNames), name))
+    if not os.path.isdir(args.out):
+        os.makedirs(args.out)
+
+    jobs = []
+    for infoName, dataName in zip(args.runs[::2], args.runs[1::2]):
+        windows = args.window or [(0, utils.readInfoFile(infoName)['nt'])]
+        jobs.append((infoName, dataName, windows, args.ring, args.center, int(args.aa), args.mmap, args.slide, args.threads, args.out))
+
+    pool = multiprocessing.Pool(args.workers)
+    try:
+        results = pool.map(reduceRun, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+    with open(os.path.join(args.out, 'summary.csv'), 'wb') as summary:
+        writer = csv.writer(summary)
+        writer.writerow(['run', 'start', 'end', 'total', 'ring_inner', 'ring_outer', 'alghoritm', 'masked_sum'])
+        for rows in results:
+            writer.writerows(rows)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,344 @@
+"""Benchmarks for every stage of the viewer pipeline.
+
+    python benchmark.py --sizes 64x64x200,256x256x1000 --windows 0.1,0.5,1 --out bench.jsonl
+
+Synthetic runs are generated deterministically into a temporary directory.
+Each stage, size and window width is measured in its own process and
+reported as one JSON object per line with the best and mean wall time,
+the throughput and the peak resident memory. Stages that need OpenGL are
+only run with --gl; everything else runs without a display.
+
+    python benchmark.py --startup --budget 1.0 [--gl]
+
+checks that importing the viewer (and with --gl, opening its window) stays
+within the time budget without loading PyOpenGL, and exits non-zero if not.
+"""
+import argparse
+import json
+import multiprocessing
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+import numpy as np
+from mainapplication.utils import cube
+from mainapplication.utils import draw
+from mainapplication.utils import mask
+from mainapplication.utils import pixelstats
+from mainapplication.utils import radial
+from mainapplication.utils import sparse
+from mainapplication.utils import synthetic
+from mainapplication.utils import utils
+from mainapplication.utils import windowindex
+
+
+STAGES = OrderedDict()
+
+
+def stage(name, windowed=False, gl=False):
+    """Register `func(run)` returning ``(callable, units, unitName)`` as a benchmark stage."""
+    def register(func):
+        STAGES[name] = (func, windowed, gl)
+        return func
+    return register
+
+
+class Run(object):
+    def __init__(self, infoName, dataName, width):
+        self.infoName = infoName
+        self.dataName = dataName
+        self.info = utils.readInfoFile(infoName)
+        self.shape = (self.info['nx'], self.info['ny'], self.info['nt'])
+        self.width = width
+        self.start = (self.shape[2] - width) // 2
+        self.end = self.start + width
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = cube.loadCube(self.dataName, self.shape, **cube.cubeFormat(self.info))
+        return self._data
+
+    @property
+    def nbytes(self):
+        return int(np.prod(self.shape)) * np.dtype(str(self.info['dtype'])).itemsize
+
+    @property
+    def ring(self):
+        nx, ny = self.shape[:2]
+        return (nx, ny), (nx/2-1, ny/2-1), (nx / 2 - 1, nx / 2 + 50)
+
+    @property
+    def radii(self):
+        radius = self.ring[2]
+        return np.arange(radius[0], radius[1], 0.1)
+
+
+@stage('load')
+def benchLoad(run):
+    return lambda: cube.loadCube(run.dataName, run.shape, **cube.cubeFormat(run.info)), run.nbytes, 'B'
+
+
+@stage('mmap_sum')
+def benchMemoryMapSum(run):
+    def go():
+        data = cube.loadCube(run.dataName, run.shape, mmap=True, **cube.cubeFormat(run.info))
+        return cube.windowSum(data, 0, run.shape[2])
+    return go, run.nbytes, 'B'
+
+
+@stage('mmap_light_curve')
+def benchMemoryMapLightCurve(run):
+    shape, center, radius = run.ring
+    masks = [mask.annulus(shape, center, radius), np.ones(shape)]
+
+    def go():
+        data = cube.loadCube(run.dataName, run.shape, mmap=True, **cube.cubeFormat(run.info))
+        return cube.lightCurves(data, masks)
+    return go, run.nbytes, 'B'
+
+
+@stage('window_sum', windowed=True)
+def benchWindowSum(run):
+    data = run.data
+    return lambda: np.sum(data[:, :, run.start:run.end], 2), data[:, :, run.start:run.end].size, 'cells'
+
+
+@stage('chunked_window_sum', windowed=True)
+def benchChunkedWindowSum(run):
+    data = run.data
+    return lambda: cube.windowSum(data, run.start, run.end), data[:, :, run.start:run.end].size, 'cells'
+
+
+@stage('window_stats', windowed=True)
+def benchWindowStats(run):
+    data = run.data
+    return lambda: pixelstats.windowStats(data, run.start, run.end), data[:, :, run.start:run.end].size, 'cells'
+
+
+@stage('index_build')
+def benchIndexBuild(run):
+    data = run.data
+    return lambda: windowindex.WindowIndex(data), data.size, 'cells'
+
+
+@stage('index_window_sum', windowed=True)
+def benchIndexWindowSum(run):
+    index = windowindex.WindowIndex(run.data)
+    return lambda: index.windowSum(run.start, run.end), run.data[:, :, run.start:run.end].size, 'cells'
+
+
+@stage('sparse_build')
+def benchSparseBuild(run):
+    data = run.data
+    return lambda: sparse.SparseCube.fromDense(data), data.size, 'cells'
+
+
+@stage('sparse_window_sum', windowed=True)
+def benchSparseWindowSum(run):
+    sparseCube = sparse.SparseCube.fromDense(run.data)
+    return lambda: sparseCube.windowSum(run.start, run.end), run.data[:, :, run.start:run.end].size, 'cells'
+
+
+def benchArrayRing(alghoritmIndex):
+    def bench(run):
+        return lambda: utils.arrayRing(*run.ring, alghoritmIndex=alghoritmIndex), len(run.radii), 'circles'
+    return bench
+
+
+def benchRingMask(alghoritmIndex):
+    def bench(run):
+        if not np.array_equal(mask.ringMask(*run.ring, alghoritmIndex=alghoritmIndex),
+                              utils.arrayRing(*run.ring, alghoritmIndex=alghoritmIndex)):
+            raise AssertionError('ringMask differs from utils.arrayRing for alghoritm %d' % alghoritmIndex)
+
+        def go():
+            mask.clearCache()
+            return mask.ringMask(*run.ring, alghoritmIndex=alghoritmIndex)
+        return go, run.shape[0] * run.shape[1], 'pixels'
+    return bench
+
+
+for _index in (0, 1):
+    stage('array_ring_%d' % _index)(benchArrayRing(_index))
+    stage('ring_mask_%d' % _index)(benchRingMask(_index))
+
+
+def benchRadialProfile(antialias):
+    def bench(run):
+        shape, center, radius = run.ring
+        bins = radial.RadialBins(shape, center, antialias)
+        plane = np.sum(run.data[:, :, run.start:run.end], 2)
+        return lambda: bins.profile(plane), plane.size, 'pixels'
+    return bench
+
+
+for _index in (0, 1):
+    stage('radial_profile_%d' % _index)(benchRadialProfile(_index == 1))
+
+
+@stage('circle_perimeter')
+def benchCirclePerimeter(run):
+    shape, center, radius = run.ring
+    return (lambda: [draw.circle_perimeter(center[1], center[0], r, shape=shape) for r in run.radii],
+            len(run.radii), 'circles')
+
+
+@stage('circle_perimeter_aa')
+def benchCirclePerimeterAA(run):
+    shape, center, radius = run.ring
+    return (lambda: [draw.circle_perimeter_aa(center[1], center[0], r, shape=shape) for r in run.radii],
+            len(run.radii), 'circles')
+
+
+@stage('circle_perimeter_batch')
+def benchCirclePerimeterBatch(run):
+    shape, center, radius = run.ring
+    return lambda: draw.circle_perimeter_batch(center[1], center[0], run.radii, shape=shape), len(run.radii), 'circles'
+
+
+@stage('circle_perimeter_aa_batch')
+def benchCirclePerimeterAABatch(run):
+    shape, center, radius = run.ring
+    return lambda: draw.circle_perimeter_aa_batch(center[1], center[0], run.radii, shape=shape), len(run.radii), 'circles'
+
+
+def _glSurfaceBench(useHeightBuffers):
+    def bench(run):
+        from PyQt4 import QtGui
+        import pyqtgraph.opengl as gl
+        from mainapplication.windows import surface
+        app = QtGui.QApplication.instance() or QtGui.QApplication(sys.argv)
+        view = gl.GLViewWidget()
+        view.show()
+        z = np.sum(run.data[:, :, run.start:run.end], 2)
+        if useHeightBuffers:
+            item = surface.HeightSurfaceItem(z=z)
+        else:
+            item = gl.GLSurfacePlotItem(z=z, shader='heightColor', computeNormals=False, smooth=False)
+        view.addItem(item)
+
+        def go():
+            item.setData(z=z)
+            view.repaint()
+            app.processEvents()
+        return go, z.size, 'pixels'
+    return bench
+
+
+stage('surface_set_data', windowed=True, gl=True)(_glSurfaceBench(False))
+stage('height_surface_set_data', windowed=True, gl=True)(_glSurfaceBench(True))
+
+
+IMPORT_CHECK = '''
+import json, sys, time
+began = time.time()
+import mainapplication.windows.mainwindow
+print json.dumps({'import_s': time.time() - began,
+                  'pyqtgraph_opengl': 'pyqtgraph.opengl' in sys.modules,
+                  'OpenGL': 'OpenGL' in sys.modules})
+'''
+
+
+def checkStartup(budget, gl):
+    """Import and startup times against `budget` seconds; GL must not load at startup."""
+    results = [json.loads(subprocess.check_output([sys.executable, '-c', IMPORT_CHECK]))]
+    if gl:
+        results.append(json.loads(subprocess.check_output([sys.executable, 'main.py', '--startup-time'])))
+    for result in results:
+        result['budget_s'] = budget
+        seconds = result.get('import_s', result.get('startup_s'))
+        result['ok'] = seconds <= budget and not result['OpenGL'] and not result['pyqtgraph_opengl']
+    return results
+
+
+def peakMemory():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(name, infoName, dataName, width, repeat, queue):
+    func, windowed, gl = STAGES[name]
+    run = Run(infoName, dataName, width)
+    go, units, unitName = func(run)
+    setupMemory = peakMemory()
+    times = []
+    for i in xrange(repeat):
+        began = time.time()
+        go()
+        times.append(time.time() - began)
+    best = min(times)
+    queue.put(OrderedDict([('stage', name),
+                           ('nx', run.shape[0]), ('ny', run.shape[1]), ('nt', run.shape[2]),
+                           ('window', width if windowed else None),
+                           ('repeat', repeat),
+                           ('best_s', best),
+                           ('mean_s', sum(times) / len(times)),
+                           ('throughput', units / best if best > 0 else None),
+                           ('unit', unitName + '/s'),
+                           ('peak_rss_kb', peakMemory()),
+                           ('stage_rss_kb', peakMemory() - setupMemory)]))
+
+
+def parseSize(text):
+    return tuple(int(n) for n in text.split('x'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the viewer pipeline on synthetic runs.')
+    parser.add_argument('--sizes', default='64x64x200,256x256x1000',
+                        help='comma separated NXxNYxNT sizes')
+    parser.add_argument('--windows', default='0.1,0.5,1',
+                        help='comma separated window widths as fractions of nt')
+    parser.add_argument('--stages', default=None, help='comma separated stage names; default all')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--gl', action='store_true', help='also run stages that need OpenGL')
+    parser.add_argument('--out', default=None, help='JSON lines output file; default stdout')
+    parser.add_argument('--startup', action='store_true',
+                        help='only check the viewer import (and with --gl startup) time against --budget')
+    parser.add_argument('--budget', type=float, default=1.0, help='startup time budget in seconds')
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        results = checkStartup(args.budget, args.gl)
+        for result in results:
+            print json.dumps(result)
+        return 0 if all(result['ok'] for result in results) else 1
+
+    names = args.stages.split(',') if args.stages else list(STAGES)
+    names = [name for name in names if args.gl or not STAGES[name][2]]
+    fractions = [float(f) for f in args.windows.split(',')]
+    out = open(args.out, 'w') if args.out else sys.stdout
+    directory = tempfile.mkdtemp(prefix='neas-bench-')
+    try:
+        for size in args.sizes.split(','):
+            nx, ny, nt = parseSize(size)
+            infoName, dataName = synthetic.writeRun(directory, size, synthetic.makeCube(nx, ny, nt, args.seed))
+            for name in names:
+                widths = [max(1, int(round(f * nt))) for f in fractions] if STAGES[name][1] else [nt]
+                for width in widths:
+                    queue = multiprocessing.Queue()
+                    process = multiprocessing.Process(target=measure,
+                                                      args=(name, infoName, dataName, width, args.repeat, queue))
+                    process.start()
+                    process.join()
+                    if queue.empty():
+                        result = OrderedDict([('stage', name), ('nx', nx), ('ny', ny), ('nt', nt),
+                                              ('window', width), ('error', process.exitcode)])
+                    else:
+                        result = queue.get()
+                    out.write(json.dumps(result) + '\n')
+                    out.flush()
+    finally:
+        shutil.rmtree(directory)
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
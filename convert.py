@@ -0,0 +1,32 @@
+"""Convert info/data file pairs into chunked container files.
+
+    python convert.py --chunks 64,64,256 --level 1 run1.info run1.dat run1.neas
+
+The container embeds the info values and the cube geometry, dtype,
+layout and chunk order, so a run is a single file that can be opened from the viewer's
+File menu or read block by block with ``container.Container``.
+"""
+import argparse
+import sys
+from mainapplication.utils import container
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert an info/data file pair into a container file.')
+    parser.add_argument('info')
+    parser.add_argument('data')
+    parser.add_argument('out')
+    parser.add_argument('--chunks', default='64,64,256', metavar='CX,CY,CT', help='chunk shape')
+    parser.add_argument('--level', type=int, default=1, help='zlib compression level')
+    parser.add_argument('--raw', action='store_true', help='store chunks uncompressed')
+    parser.add_argument('--workers', type=int, default=None, help='compression threads; default one per CPU')
+    args = parser.parse_args(argv)
+
+    chunks = tuple(int(n) for n in args.chunks.split(','))
+    container.convert(args.info, args.data, args.out, chunks=chunks,
+                      compression=None if args.raw else 'zlib', level=args.level, workers=args.workers)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,25 @@
+import json
 import sys
+import time
+_began = time.time()
 from PyQt4 import QtCore, QtGui
 from windows import mainwindow
 
 
+def reportStartup(app):
+    """Print the startup time and the lazily imported modules already loaded, then quit."""
+    print json.dumps({'startup_s': time.time() - _began,
+                      'pyqtgraph_opengl': 'pyqtgraph.opengl' in sys.modules,
+                      'OpenGL': 'OpenGL' in sys.modules})
+    app.quit()
+
+
 def run():
     app = QtGui.QApplication(sys.argv)
     if (sys.flags.interactive != 1) or not hasattr(QtCore, 'PYQT_VERSION'):
         mw = mainwindow.MainWindow()
         app.setActiveWindow(mw)
-        app.exec_()
\ No newline at end of file
+        if '--startup-time' in sys.argv:
+            # queued behind the deferred control panel, so the window is usable
+            QtCore.QTimer.singleShot(0, lambda: reportStartup(app))
+        app.exec_()
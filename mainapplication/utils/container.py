@@ -0,0 +1,182 @@
+"""Self-describing chunked cube container.
+
+Layout of a container file::
+
+    magic 'NEASCUBE' | uint64 table offset | uint32 header length | JSON header
+    padding to `alignment`
+    chunk 0 | padding | chunk 1 | padding | ...
+    chunk table: uint64 (offset, stored bytes) per chunk
+
+The JSON header holds the format version, the (nx, ny, nt) shape, dtype,
+layout, chunk shape, chunk order, compression and the info file values as
+metadata. The only layout is 'pixel': cells are indexed (x, y, t) whatever
+the layout of the raw file was. Chunks tile the cube in C order of the
+chunk grid ('C' chunk order) and each one is the C-ordered block of cells
+it covers, optionally compressed with zlib. The table gives every chunk's
+offset, so any time or spatial sub-block is read without scanning the file.
+"""
+import json
+import multiprocessing
+import struct
+import threading
+import zlib
+from multiprocessing.pool import ThreadPool
+import numpy as np
+import cube
+import utils
+
+
+MAGIC = 'NEASCUBE'
+PREFIX = struct.Struct('<8sQI')
+# version 1 files predate the layout fields and are always 'pixel'/'C'
+VERSION = 2
+VERSIONS = (1, 2)
+LAYOUTS = ('pixel',)
+CHUNK_ORDERS = ('C',)
+
+
+def _align(position, alignment):
+    return -(-position // alignment) * alignment
+
+
+def _chunkSlices(shape, chunks, index):
+    return tuple(slice(i * c, min((i + 1) * c, n)) for i, c, n in zip(index, chunks, shape))
+
+
+def writeContainer(fileName, data, chunks=(64, 64, 256), compression='zlib', level=1,
+                   metadata=None, alignment=4096, workers=None):
+    """Write an (nx, ny, nt) cube to `fileName` as a chunked container."""
+    shape = data.shape
+    chunks = tuple(min(c, n) if n else c for c, n in zip(chunks, shape))
+    grid = tuple(-(-n // c) for n, c in zip(shape, chunks))
+    header = json.dumps({'version': VERSION,
+                         'shape': list(shape),
+                         'dtype': data.dtype.str,
+                         'layout': 'pixel',
+                         'chunks': list(chunks),
+                         'chunkOrder': 'C',
+                         'compression': compression,
+                         'alignment': alignment,
+                         'metadata': metadata or {}})
+    table = np.zeros((int(np.prod(grid)), 2), dtype=np.uint64)
+
+    def encode(index):
+        block = np.ascontiguousarray(data[_chunkSlices(shape, chunks, index)]).tostring()
+        if compression == 'zlib':
+            block = zlib.compress(block, level)
+        elif compression is not None:
+            raise ValueError('Wrong compression')
+        return block
+
+    pool = ThreadPool(workers)
+    try:
+        with open(fileName, 'wb') as output:
+            output.write(PREFIX.pack(MAGIC, 0, len(header)))
+            output.write(header)
+            position = _align(PREFIX.size + len(header), alignment)
+            indices = list(np.ndindex(*grid))
+            # encode a bounded batch of chunks at a time in parallel
+            batch = 4 * (workers or multiprocessing.cpu_count())
+            for first in xrange(0, len(indices), batch):
+                blocks = pool.map(encode, indices[first:first + batch])
+                for i, block in enumerate(blocks):
+                    output.seek(position)
+                    output.write(block)
+                    table[first + i] = (position, len(block))
+                    position = _align(position + len(block), alignment)
+            output.seek(position)
+            output.write(table.astype('<u8').tostring())
+            output.seek(0)
+            output.write(PREFIX.pack(MAGIC, position, len(header)))
+    finally:
+        pool.close()
+        pool.join()
+
+
+class Container(object):
+    """Reader for files written by `writeContainer`."""
+
+    def __init__(self, fileName, workers=None):
+        self.fileName = fileName
+        self._file = open(fileName, 'rb')
+        self._lock = threading.Lock()
+        magic, tableOffset, headerLength = PREFIX.unpack(self._file.read(PREFIX.size))
+        if magic != MAGIC:
+            raise ValueError('Not a container file: %s' % fileName)
+        self.header = json.loads(self._file.read(headerLength))
+        version = self.header.get('version')
+        if version not in VERSIONS:
+            raise ValueError('Unsupported container version %s: %s' % (version, fileName))
+        if version == 1:
+            self.header.update(layout='pixel', chunkOrder='C')
+        if self.header.get('layout') not in LAYOUTS or self.header.get('chunkOrder') not in CHUNK_ORDERS:
+            raise ValueError('Unsupported container layout %s/%s: %s' % (
+                self.header.get('layout'), self.header.get('chunkOrder'), fileName))
+        self.shape = tuple(self.header['shape'])
+        self.dtype = np.dtype(str(self.header['dtype']))
+        self.chunks = tuple(self.header['chunks'])
+        self.grid = tuple(-(-n // c) for n, c in zip(self.shape, self.chunks))
+        self.metadata = self.header['metadata']
+        self._file.seek(tableOffset)
+        count = int(np.prod(self.grid))
+        self.table = np.fromstring(self._file.read(count * 16), dtype='<u8').reshape(count, 2)
+        self.workers = workers
+
+    def close(self):
+        self._file.close()
+
+    def info(self):
+        """Info file values of the stored run with the stored geometry."""
+        result = dict((str(key), value) for key, value in self.metadata.items())
+        result.update(nx=self.shape[0], ny=self.shape[1], nt=self.shape[2])
+        return result
+
+    def readChunk(self, index):
+        offset, length = self.table[np.ravel_multi_index(index, self.grid)]
+        with self._lock:
+            self._file.seek(int(offset))
+            block = self._file.read(int(length))
+        if self.header['compression'] == 'zlib':
+            block = zlib.decompress(block)
+        slices = _chunkSlices(self.shape, self.chunks, index)
+        return np.fromstring(block, dtype=self.dtype).reshape([s.stop - s.start for s in slices])
+
+    def read(self, x=slice(None), y=slice(None), t=slice(None)):
+        """Read the sub-block ``cube[x, y, t]``; only chunks overlapping it are touched."""
+        bounds = [s.indices(n)[:2] for s, n in zip((x, y, t), self.shape)]
+        result = np.empty([max(0, b - a) for a, b in bounds], dtype=self.dtype)
+        if not result.size:
+            return result
+        ranges = [xrange(a // c, -(-b // c)) for (a, b), c in zip(bounds, self.chunks)]
+        indices = [(i, j, k) for i in ranges[0] for j in ranges[1] for k in ranges[2]]
+
+        def place(index):
+            block = self.readChunk(index)
+            slices = _chunkSlices(self.shape, self.chunks, index)
+            source = []
+            target = []
+            for s, (a, b) in zip(slices, bounds):
+                lo, hi = max(s.start, a), min(s.stop, b)
+                source.append(slice(lo - s.start, hi - s.start))
+                target.append(slice(lo - a, hi - a))
+            result[tuple(target)] = block[tuple(source)]
+
+        if len(indices) == 1:
+            place(indices[0])
+            return result
+        pool = ThreadPool(self.workers)
+        try:
+            pool.map(place, indices)
+        finally:
+            pool.close()
+            pool.join()
+        return result
+
+
+def convert(infoName, dataName, fileName, **kwargs):
+    """Convert an info file and raw data file pair into a container."""
+    info = utils.readInfoFile(infoName)
+    data = cube.loadCube(dataName, (info['nx'], info['ny'], info['nt']), mmap=True, **cube.cubeFormat(info))
+    metadata = dict((key, value) for key, value in info.items()
+                    if key not in ('nx', 'ny', 'nt', 'dtype', 'byteorder', 'offset', 'layout'))
+    writeContainer(fileName, data, metadata=metadata, **kwargs)
@@ -0,0 +1,180 @@
+import numpy as np
+import parallel
+from windowindex import accumulatorDtype
+
+
+BYTEORDERS = {'little': '<', 'big': '>', 'native': '=',
+              '<': '<', '>': '>', '=': '=', '|': '|'}
+
+
+LAYOUTS = ('pixel', 'frame')
+
+
+def cubeFormat(info):
+    """Raw cube format (dtype, byteorder, offset, layout) described by an info file dict."""
+    return {'dtype': str(info.get('dtype', 'uint32')),
+            'byteorder': BYTEORDERS[str(info.get('byteorder', 'native'))],
+            'offset': int(info.get('offset', 0)),
+            'layout': str(info.get('layout', 'pixel'))}
+
+
+def fromFrames(frames):
+    """(nx, ny, nt) view of a frame-major (nt, nx, ny) array."""
+    return np.rollaxis(frames, 0, 3)
+
+
+def loadCube(fileName, shape, dtype=np.uint32, byteorder='=', offset=0, layout='pixel', mmap=False,
+             narrow=False, chunkBytes=64 * 1024 ** 2):
+    """Load a raw cube as an (nx, ny, nt) array.
+
+    `layout` is 'pixel' when the file holds the nt time bins of each pixel
+    in turn, or 'frame' when it holds nt (nx, ny) frames; frame-major files
+    are returned as a transposed view. With ``mmap=True`` the file is
+    memory-mapped read-only and nothing is read until it is indexed, so
+    cubes larger than RAM can be opened. With ``narrow=True`` an in-memory
+    cube is stored in the narrowest integer dtype holding its values, found
+    by a streaming scan, and never exists at the file's width.
+    """
+    if layout not in LAYOUTS:
+        raise ValueError('Wrong layout')
+    dtype = np.dtype(dtype).newbyteorder(byteorder)
+    fileShape = shape if layout == 'pixel' else (shape[2], shape[0], shape[1])
+    if mmap or narrow:
+        result = np.memmap(fileName, dtype=dtype, mode='r', offset=offset, shape=fileShape)
+        if not mmap:
+            result = narrowCopy(result, chunkBytes)
+    else:
+        with open(fileName, 'rb') as dataFile:
+            dataFile.seek(offset)
+            result = np.fromfile(dataFile, dtype=dtype, count=int(np.prod(shape)))
+        if not result.dtype.isnative:
+            result = result.astype(result.dtype.newbyteorder('='))
+        result = result.reshape(fileShape)
+    if layout == 'frame':
+        return fromFrames(result)
+    return result
+
+
+def _blocks(data, chunkBytes):
+    """Slices of the first axis of `data` of about `chunkBytes` each."""
+    step = max(1, int(chunkBytes // max(1, data[:1].nbytes)))
+    for i in xrange(0, data.shape[0], step):
+        yield slice(i, i + step)
+
+
+def valueRange(data, chunkBytes=64 * 1024 ** 2):
+    """Smallest and largest value of `data`, scanned a block at a time."""
+    if not data.size:
+        return 0, 0
+    low, high = None, None
+    for block in _blocks(data, chunkBytes):
+        part = data[block]
+        low = part.min() if low is None else min(low, part.min())
+        high = part.max() if high is None else max(high, part.max())
+    return low, high
+
+
+def narrowDtype(low, high, dtype):
+    """Narrowest integer dtype holding ``[low, high]``; other dtypes are kept."""
+    dtype = np.dtype(dtype)
+    if dtype.kind not in 'ui':
+        return dtype.newbyteorder('=')
+    candidates = (np.uint8, np.uint16, np.uint32, np.uint64) if low >= 0 else \
+        (np.int8, np.int16, np.int32, np.int64)
+    for candidate in candidates:
+        info = np.iinfo(candidate)
+        if info.min <= low and high <= info.max:
+            return np.dtype(candidate)
+    return dtype.newbyteorder('=')
+
+
+def narrowCopy(data, chunkBytes=64 * 1024 ** 2):
+    """In-memory copy of `data` in its narrowest dtype, converted a block at a time."""
+    result = np.empty(data.shape, dtype=narrowDtype(*valueRange(data, chunkBytes), dtype=data.dtype))
+    for block in _blocks(data, chunkBytes):
+        result[block] = data[block]
+    return result
+
+
+def chunkRows(data, frames, chunkBytes):
+    """Number of leading rows of `data` whose `frames` time bins fit in `chunkBytes`."""
+    return max(1, int(chunkBytes // max(1, data.shape[1] * frames * data.dtype.itemsize)))
+
+
+def windowSum(data, start, end, chunkBytes=64 * 1024 ** 2, workers=None):
+    """Sum frames ``[start, end)`` of a (nx, ny, nt) cube a block of rows at a time.
+
+    Only ``chunkBytes`` of the cube are touched per step, so the reduction
+    stays bounded on memory-mapped cubes. Large windows are reduced in
+    tiles of rows on `workers` threads (see `parallel`).
+    """
+    return parallel.sumFrames(data, start, end, accumulatorDtype(data.dtype), chunkBytes, workers)
+
+
+def maskedSum(data, mask, start, end, chunkBytes=64 * 1024 ** 2, workers=None):
+    """Total of frames ``[start, end)`` weighted by the (nx, ny) `mask`, without the full window plane."""
+    return parallel.maskedSum(data, mask, start, end, accumulatorDtype(data.dtype), chunkBytes, workers)
+
+
+def lightCurves(data, masks, chunkBytes=64 * 1024 ** 2):
+    """Mask-weighted total of every time bin of a (nx, ny, nt) cube.
+
+    `masks` is one (nx, ny) mask or a stack of them; the result is a (nt,)
+    curve or one curve per mask. The cube is streamed through tensordot in
+    blocks of about ``chunkBytes``, taken along its contiguous axis: rows
+    for pixel-major cubes, frames for frame-major ones.
+    """
+    masks = np.asarray(masks)
+    single = masks.ndim == 2
+    if single:
+        masks = masks[np.newaxis]
+    nx, ny, nt = data.shape
+    result = np.zeros((len(masks), nt), dtype=np.float64)
+    if data.strides[2] > data.strides[0]:
+        frames = max(1, int(chunkBytes // max(1, nx * ny * data.dtype.itemsize)))
+        for t in xrange(0, nt, frames):
+            result[:, t:t + frames] = np.tensordot(masks, data[:, :, t:t + frames], 2)
+    else:
+        rows = chunkRows(data, nt, chunkBytes)
+        for i in xrange(0, nx, rows):
+            result += np.tensordot(masks[:, i:i + rows], data[i:i + rows], 2)
+    return result[0] if single else result
+
+
+def rebin(data, factors, chunkBytes=64 * 1024 ** 2):
+    """Sum (fx, fy, ft) blocks of a (nx, ny, nt) cube.
+
+    Cells left over at the end of an axis that do not fill a whole block
+    are dropped. The cube is read a block of whole bins at a time along its
+    outermost axis in memory, so a memory-mapped cube is never read in
+    full; the result is in the accumulator dtype.
+    """
+    factors = tuple(int(f) for f in factors)
+    shape = tuple(n // f for n, f in zip(data.shape, factors))
+    result = np.zeros(shape, dtype=accumulatorDtype(data.dtype))
+    if not result.size:
+        return result
+    data = data[:shape[0] * factors[0], :shape[1] * factors[1], :shape[2] * factors[2]]
+    axis = int(np.argmax(np.abs(data.strides)))
+    binBytes = data.nbytes // data.shape[axis] * factors[axis]
+    step = max(1, int(chunkBytes // max(1, binBytes)))
+    for i in xrange(0, shape[axis], step):
+        source = [slice(None)] * 3
+        target = [slice(None)] * 3
+        source[axis] = slice(i * factors[axis], (i + step) * factors[axis])
+        target[axis] = slice(i, i + step)
+        block = data[tuple(source)]
+        n = block.shape
+        block = block.reshape(n[0] // factors[0], factors[0], n[1] // factors[1], factors[1],
+                              n[2] // factors[2], factors[2])
+        np.sum(block, axis=(1, 3, 5), dtype=result.dtype, out=result[tuple(target)])
+    return result
+
+
+def rebinInfo(info, factors):
+    """Info values describing the cube rebinned by `factors`."""
+    result = dict(info)
+    for key, factor in zip(('nx', 'ny', 'nt'), factors):
+        result[key] = info[key] // int(factor)
+    result['binning'] = tuple(int(f) for f in factors)
+    return result
@@ -0,0 +1,71 @@
+from collections import OrderedDict
+import instrument
+
+
+def _same(a, b):
+    # only plain values are compared by value; arrays and dicts by identity
+    if a is b:
+        return True
+    if type(a) in (tuple, int, long, float, str, bool) and type(a) is type(b):
+        return a == b
+    return False
+
+
+class Node(object):
+    """One stage of a lazily evaluated pipeline.
+
+    A node without `compute` is a source whose value is set from outside.
+    Other nodes memoize ``compute(*inputs)`` until one of their inputs
+    changes, and `count` tells how many times the value was (re)computed.
+    """
+
+    def __init__(self, name, compute=None, inputs=()):
+        self.name = name
+        self.compute = compute
+        self.inputs = list(inputs)
+        self.outputs = []
+        for node in self.inputs:
+            node.outputs.append(self)
+        self.value = None
+        self.dirty = compute is not None
+        self.count = 0
+
+    def set(self, value):
+        if self.count and _same(value, self.value):
+            return
+        self.value = value
+        self.count += 1
+        self.invalidate()
+
+    def invalidate(self):
+        for node in self.outputs:
+            node.value = None
+            if not node.dirty:
+                node.dirty = True
+                node.invalidate()
+
+    def get(self):
+        if self.dirty:
+            inputs = [node.get() for node in self.inputs]
+            with instrument.span(self.name):
+                self.value = self.compute(*inputs)
+            self.dirty = False
+            self.count += 1
+        return self.value
+
+
+class Graph(object):
+    def __init__(self):
+        self.nodes = OrderedDict()
+
+    def add(self, name, compute=None, inputs=()):
+        node = Node(name, compute, [self.nodes[i] for i in inputs])
+        self.nodes[name] = node
+        return node
+
+    def __getitem__(self, name):
+        return self.nodes[name]
+
+    def counts(self):
+        """Number of times each node was set or recomputed, by name."""
+        return OrderedDict((name, node.count) for name, node in self.nodes.items())
@@ -226,6 +226,221 @@ def circle_perimeter_aa(cy, cx, radius,
             np.array(val, dtype=np.float))
 
 
+def _batch_arrays(cy, cx, radius):
+    """Broadcast centres and radii of a batch to 1-D float arrays."""
+    radius, cy, cx = np.broadcast_arrays(np.atleast_1d(np.asarray(radius, dtype=np.float)),
+                                         np.atleast_1d(cy), np.atleast_1d(cx))
+    return cy.ravel(), cx.ravel(), radius.ravel()
+
+
+# circles traced together when their coordinates are returned; bounds the
+# per-step arrays kept until they are concatenated
+BATCH_CIRCLES = 256
+
+
+def _batch_concatenate(steps, cy, cx, shape, weighted=False):
+    """Concatenate per-step batch coordinates circle by circle.
+
+    `steps` is a list of ``(valid, rr, cc)`` (``(valid, rr, cc, val)`` if
+    `weighted`) with `valid` of shape (n,) and the rest of shape (n, k_i), one
+    entry per iteration of the scalar algorithm. The result lists the pixels of the
+    first circle, then the second and so on, each in the order the scalar
+    function yields them.
+    """
+    n = len(cy)
+    val = None
+    if not steps or n == 0:
+        rr = cc = np.zeros(0, dtype=np.intp)
+        if weighted:
+            val = np.zeros(0)
+    else:
+        valid = np.concatenate([np.repeat(s[0][:, np.newaxis], s[1].shape[1], 1)
+                                for s in steps], 1)
+
+        def gather(i):
+            return np.concatenate([s[i] for s in steps], 1)[valid]
+
+        counts = valid.sum(1)
+        rr = gather(1).astype(np.intp) + np.repeat(cy, counts)
+        cc = gather(2).astype(np.intp) + np.repeat(cx, counts)
+        if weighted:
+            val = gather(3).astype(np.float)
+    if shape is not None:
+        if val is not None:
+            return _coords_inside_image(rr, cc, shape, val=val)
+        return _coords_inside_image(rr, cc, shape)
+    if val is not None:
+        return rr, cc, val
+    return rr, cc
+
+
+def _draw_step(step, cy, cx, shape, out):
+    """Max-combine the pixels of one batch iteration into `out`.
+
+    Neighbouring circles of a batch mostly hit the same pixels at the same
+    iteration, so runs of circles with equal coordinates are reduced first
+    and ufunc.at only sees the distinct ones.
+    """
+    valid = step[0]
+    rr = step[1][valid].astype(np.intp) + cy[valid, np.newaxis]
+    cc = step[2][valid].astype(np.intp) + cx[valid, np.newaxis]
+    val = step[3][valid].astype(np.float) if len(step) > 3 else None
+    if len(rr) > 1:
+        runs = np.flatnonzero(np.r_[True, ((rr[1:] != rr[:-1]) | (cc[1:] != cc[:-1])).any(1)])
+        rr, cc = rr[runs], cc[runs]
+        if val is not None:
+            val = np.maximum.reduceat(val, runs, axis=0)
+    if val is not None:
+        rr, cc, val = _coords_inside_image(rr.ravel(), cc.ravel(), shape, val=val.ravel())
+        np.maximum.at(out, (rr, cc), val)
+    else:
+        rr, cc = _coords_inside_image(rr.ravel(), cc.ravel(), shape)
+        np.maximum.at(out, (rr, cc), 1)
+
+
+def _trace(steps, cy, cx, radius, shape, out, weighted=False):
+    """Draw into `out`, or list the pixels of, the circles traced by ``steps(radius)``.
+
+    Drawing applies every iteration as it is traced, so nothing grows with
+    the number of circles; listing traces `BATCH_CIRCLES` circles at a time.
+    """
+    if out is not None:
+        if shape is None:
+            shape = out.shape
+        for step in steps(radius):
+            _draw_step(step, cy, cx, shape, out)
+        return out
+    parts = [_batch_concatenate(list(steps(radius[i:i + BATCH_CIRCLES])), cy[i:i + BATCH_CIRCLES],
+                                cx[i:i + BATCH_CIRCLES], shape, weighted)
+             for i in xrange(0, len(radius), BATCH_CIRCLES)]
+    if len(parts) == 1:
+        return parts[0]
+    if not parts:
+        return _batch_concatenate([], cy, cx, shape, weighted)
+    return tuple(np.concatenate(part) for part in zip(*parts))
+
+
+def _perimeter_steps(radius, method):
+    """Iterations of `circle_perimeter` for every radius at once, as ``(valid, rr, cc)``."""
+    x = np.zeros_like(radius)
+    y = radius.copy()
+    if method == 'bresenham':
+        d = 3 - 2 * radius
+    elif method == 'andres':
+        d = radius - 1
+    else:
+        raise ValueError('Wrong method')
+
+    active = y >= x
+    while active.any():
+        yield (active,
+               np.array([y, -y, y, -y, x, -x, x, -x]).T,
+               np.array([x, x, -x, -x, y, y, -y, -y]).T)
+        if method == 'bresenham':
+            inside = d < 0
+            d = np.where(active, np.where(inside, d + 4 * x + 6, d + 4 * (x - y) + 10), d)
+            y = np.where(active & ~inside, y - 1, y)
+            x = np.where(active, x + 1, x)
+        else:
+            first = d >= 2 * (x - 1)
+            second = ~first & (d <= 2 * (radius - y))
+            third = ~first & ~second
+            d = np.where(active, np.where(first, d - 2 * x,
+                                          np.where(second, d + 2 * y - 1, d + 2 * (y - x - 1))), d)
+            newX = np.where(active & (first | third), x + 1, x)
+            y = np.where(active & (second | third), y - 1, y)
+            x = newX
+        active = y >= x
+
+
+def _perimeter_aa_steps(radius):
+    """Iterations of `circle_perimeter_aa` for every radius at once, as ``(valid, rr, cc, val)``."""
+    x = 0
+    y = radius.copy()
+    # squared with Python's pow, which can differ from numpy's x*x in the
+    # last bit, so values match circle_perimeter_aa exactly
+    radius2 = np.array([r ** 2 for r in radius.tolist()])
+    zero = np.zeros_like(radius)
+    one = np.ones((len(radius), 8))
+    dceil_prev = zero
+
+    yield (np.ones(len(radius), dtype=bool),
+           np.array([y, zero, y, zero, -y, zero, -y, zero]).T,
+           np.array([zero, y, zero, -y, zero, y, zero, -y]).T,
+           one)
+
+    active = y > x + 1
+    while active.any():
+        x += 1
+        dceil = np.sqrt(np.where(active, radius2 - x ** 2, 0))
+        dceil = np.ceil(dceil) - dceil
+        y = np.where(active & (dceil < dceil_prev), y - 1, y)
+        xs = np.full_like(radius, x)
+        yield (active,
+               np.array([y, y - 1, xs, xs, y, y - 1, xs, xs,
+                         -y, 1 - y, -xs, -xs, -y, 1 - y, -xs, -xs]).T,
+               np.array([xs, xs, y, y - 1, -xs, -xs, -y, 1 - y] * 2).T,
+               np.array([1 - dceil, dceil] * 8).T)
+        dceil_prev = np.where(active, dceil, dceil_prev)
+        active = y > x + 1
+
+
+def circle_perimeter_batch(cy, cx, radius, method='bresenham', shape=None, out=None):
+    """Generate perimeter coordinates of many circles at once.
+    Parameters
+    ----------
+    cy, cx : int or (N,) array_like of int
+        Centre coordinates, broadcast against `radius`.
+    radius : (N,) array_like
+        Radii of circles.
+    method : {'bresenham', 'andres'}, optional
+        See `circle_perimeter`.
+    shape : tuple, optional
+        Image shape used to clip output coordinates. Defaults to
+        ``out.shape`` when `out` is given.
+    out : (M, N) ndarray, optional
+        Image the perimeters are drawn into with max-combine semantics,
+        i.e. ``out[rr, cc] = max(out[rr, cc], 1)``.
+    Returns
+    -------
+    rr, cc : ndarray of int
+        Concatenation of ``circle_perimeter(cy[i], cx[i], radius[i])`` over
+        all circles. Every circle is traced by the same vectorized loop, so
+        the cost is one pass over the largest radius instead of one Python
+        loop per circle. When `out` is given the perimeters are only drawn
+        into it, step by step, and `out` is returned instead.
+    """
+    cy, cx, radius = _batch_arrays(cy, cx, radius)
+    if method not in ('bresenham', 'andres'):
+        raise ValueError('Wrong method')
+    return _trace(lambda radius: _perimeter_steps(radius, method), cy, cx, radius, shape, out)
+
+
+def circle_perimeter_aa_batch(cy, cx, radius, shape=None, out=None):
+    """Generate anti-aliased perimeter coordinates of many circles at once.
+    Parameters
+    ----------
+    cy, cx : int or (N,) array_like of int
+        Centre coordinates, broadcast against `radius`.
+    radius : (N,) array_like
+        Radii of circles.
+    shape : tuple, optional
+        Image shape used to clip output coordinates. Defaults to
+        ``out.shape`` when `out` is given.
+    out : (M, N) ndarray, optional
+        Image the perimeters are drawn into with max-combine semantics,
+        i.e. ``out[rr, cc] = max(out[rr, cc], val)``.
+    Returns
+    -------
+    rr, cc, val : ndarray (int, int, float)
+        Concatenation of ``circle_perimeter_aa(cy[i], cx[i], radius[i])``
+        over all circles. When `out` is given the perimeters are only drawn
+        into it, step by step, and `out` is returned instead.
+    """
+    cy, cx, radius = _batch_arrays(cy, cx, radius)
+    return _trace(_perimeter_aa_steps, cy, cx, radius, shape, out, weighted=True)
+
+
 def _ellipse_in_shape(shape, center, radiuses):
     """Generate coordinates of points within ellipse bounded by shape."""
     y, x = np.ogrid[0:float(shape[0]), 0:float(shape[1])]
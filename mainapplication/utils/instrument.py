@@ -0,0 +1,113 @@
+"""Optional timing of the viewer hot paths.
+
+Spans are only recorded while `enabled` is set; otherwise `span` hands back
+a shared no-op context manager and `timed` functions cost one extra call.
+Recorded spans feed rolling per-stage latencies for the status bar and can
+be written out in the Chrome trace event format (chrome://tracing,
+Perfetto).
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque, OrderedDict
+
+
+enabled = False
+window = 50
+maxEvents = 100000
+
+_events = deque(maxlen=maxEvents)
+_latencies = OrderedDict()
+_frames = deque(maxlen=120)
+_origin = time.time()
+
+
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_nullSpan = _NullSpan()
+
+
+class _Span(object):
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.began = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, self.began, time.time())
+        return False
+
+
+def record(name, began, ended):
+    _events.append((name, began, ended, threading.current_thread().ident))
+    if name not in _latencies:
+        _latencies[name] = deque(maxlen=window)
+    _latencies[name].append(ended - began)
+
+
+def span(name):
+    if not enabled:
+        return _nullSpan
+    return _Span(name)
+
+
+def timed(name):
+    """Decorator recording every call of the function as a span called `name`."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            with _Span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def frame():
+    """Mark a rendered frame for the frame rate."""
+    if enabled:
+        _frames.append(time.time())
+
+
+def frameRate():
+    if len(_frames) < 2 or time.time() - _frames[-1] > 1.:
+        return 0.
+    return (len(_frames) - 1) / (_frames[-1] - _frames[0])
+
+
+def latencies():
+    """Mean of the last `window` durations of every stage, in seconds."""
+    return OrderedDict((name, sum(values) / len(values)) for name, values in list(_latencies.items()))
+
+
+def summary():
+    parts = ['%s %.1f ms' % (name, value * 1000) for name, value in latencies().items()]
+    parts.append('%.1f fps' % frameRate())
+    return ' | '.join(parts)
+
+
+def reset():
+    _events.clear()
+    _latencies.clear()
+    _frames.clear()
+
+
+def exportTrace(fileName):
+    """Write the recorded spans as a Chrome trace event file."""
+    pid = os.getpid()
+    events = [{'name': name, 'ph': 'X', 'pid': pid, 'tid': tid,
+               'ts': (began - _origin) * 1e6, 'dur': (ended - began) * 1e6}
+              for name, began, ended, tid in list(_events)]
+    with open(fileName, 'w') as traceFile:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, traceFile)
@@ -0,0 +1,54 @@
+import numpy as np
+
+
+REDUCERS = {'sum': np.add, 'max': np.maximum}
+
+
+def blockReduce(plane, factor, method='max'):
+    """Aggregate `plane` over factor x factor blocks; edge blocks may be smaller.
+
+    'max' keeps peaks at their height, 'sum' keeps block totals (heights
+    grow by up to factor**2).
+    """
+    if factor == 1:
+        return plane
+    reducer = REDUCERS[method]
+    rows = np.arange(0, plane.shape[0], factor)
+    cols = np.arange(0, plane.shape[1], factor)
+    return reducer.reduceat(reducer.reduceat(plane, rows, 0), cols, 1)
+
+
+def triangleCount(shape, factor=1):
+    rows = -(-shape[0] // factor)
+    cols = -(-shape[1] // factor)
+    return 2 * max(rows - 1, 0) * max(cols - 1, 0)
+
+
+def levelFor(shape, triangleBudget):
+    """Smallest power-of-two block size whose surface fits in `triangleBudget`."""
+    factor = 1
+    while triangleCount(shape, factor) > triangleBudget and factor < max(shape):
+        factor *= 2
+    return factor
+
+
+class SurfacePyramid(object):
+    """Lazily built power-of-two block aggregates of one surface plane."""
+
+    def __init__(self, plane, method='max'):
+        self.method = method
+        self.levels = {1: plane}
+
+    @property
+    def shape(self):
+        return self.levels[1].shape
+
+    def level(self, factor):
+        if factor not in self.levels:
+            # blocks of a power of two are unions of the half-size blocks
+            self.levels[factor] = blockReduce(self.level(factor // 2), 2, self.method)
+        return self.levels[factor]
+
+    def forBudget(self, triangleBudget):
+        factor = levelFor(self.shape, triangleBudget)
+        return factor, self.level(factor)
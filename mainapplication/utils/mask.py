@@ -0,0 +1,104 @@
+from collections import OrderedDict
+import numpy as np
+import instrument
+import utils
+
+
+cacheSize = 8
+_cache = OrderedDict()
+_patterns = OrderedDict()
+
+
+def distanceGrid(shape, center):
+    """Distance of every pixel of `shape` from `center`.
+
+    `center` is given as (x, y) like ``utils.arrayRing``: ``center[1]`` is
+    the row and ``center[0]`` the column.
+    """
+    rows, cols = np.ogrid[0:shape[0], 0:shape[1]]
+    return np.hypot(rows - center[1], cols - center[0])
+
+
+def annulus(shape, center, radius, antialias=False):
+    """Ring mask with inner/outer radii `radius` built from a distance grid.
+
+    The hard mask keeps pixels with ``radius[0] - 0.5 <= d < radius[1] - 0.5``
+    and the anti-aliased one ramps linearly over one pixel across each edge.
+    It only approximates ``utils.arrayRing``, whose swept float-radius
+    circles are truncated to pixels; `ringMask` gives the exact masks.
+    """
+    distance = distanceGrid(shape, center)
+    if antialias:
+        inner = np.clip(distance - radius[0] + 1, 0, 1)
+        outer = np.clip(radius[1] - distance, 0, 1)
+        return np.minimum(inner, outer)
+    return ((distance >= radius[0] - 0.5) & (distance < radius[1] - 0.5)).astype(np.float)
+
+
+def _cached(cache, key, build):
+    """LRU lookup in `cache`, calling `build` on a miss."""
+    if key in cache:
+        result = cache.pop(key)
+    else:
+        result = build()
+    cache[key] = result
+    while len(cache) > cacheSize:
+        cache.popitem(last=False)
+    return result
+
+
+def _ringPattern(radius, alghoritmIndex):
+    """``utils.arrayRing`` around the middle of a square just big enough for it."""
+    half = int(np.ceil(max(radius))) + 2
+    return utils.arrayRing((2 * half + 1, 2 * half + 1), (half, half), radius, alghoritmIndex)
+
+
+def _placePattern(size, center, pattern):
+    """Copy the part of a `_ringPattern` centered on `center` that falls inside `size`."""
+    half = pattern.shape[0] // 2
+    result = np.zeros(size)
+    top, left = center[1] - half, center[0] - half
+    rows = slice(max(top, 0), min(top + pattern.shape[0], size[0]))
+    cols = slice(max(left, 0), min(left + pattern.shape[1], size[1]))
+    if rows.start < rows.stop and cols.start < cols.stop:
+        result[rows, cols] = pattern[rows.start - top:rows.stop - top, cols.start - left:cols.stop - left]
+    return result
+
+
+@instrument.timed('ringMask')
+def ringMask(size, center, radius, alghoritmIndex=0):
+    """Cached ``utils.arrayRing``.
+
+    Masks around whole-pixel centers are drawn by the batched perimeter
+    path of ``utils.arrayRing``, so they are the same for both algorithms;
+    other centers fall back to `annulus`. The traced ring only depends on
+    the offsets from the center, so it is traced once per (radius,
+    alghoritmIndex) and cropped for every center, unless it is much bigger
+    than the mask. Masks are keyed by (size, center, radius, alghoritmIndex)
+    and returned read-only, since the same array is handed out on every hit.
+    """
+    def build():
+        if alghoritmIndex not in (0, 1):
+            raise ValueError('Wrong alghoritm index')
+        if all(float(c).is_integer() for c in center):
+            center_ = tuple(int(c) for c in center)
+            side = 2 * (int(np.ceil(max(radius))) + 2) + 1
+            if side * side > 4 * size[0] * size[1]:
+                result = utils.arrayRing(tuple(size), center_, radius, alghoritmIndex)
+            else:
+                pattern = _cached(_patterns, (tuple(radius), alghoritmIndex),
+                                  lambda: _ringPattern(radius, alghoritmIndex))
+                result = _placePattern(tuple(size), center_, pattern)
+        else:
+            # perimeters are only drawn around whole pixels; binned rings
+            # can be centered between them
+            result = annulus(size, center, radius, antialias=alghoritmIndex == 1)
+        result.flags.writeable = False
+        return result
+
+    return _cached(_cache, (tuple(size), tuple(center), tuple(radius), alghoritmIndex), build)
+
+
+def clearCache():
+    _cache.clear()
+    _patterns.clear()
@@ -0,0 +1,98 @@
+"""Tiled reductions over the rows of (nx, ny, ...) arrays on a shared thread pool.
+
+NumPy releases the GIL inside sums and ufuncs, so tiles of rows are
+reduced concurrently, each writing its own rows of a preallocated output.
+Work smaller than `minBytes`, or a `workers` count of 1, runs on the
+calling thread in blocks of ``chunkBytes``, where starting tasks would cost
+more than they save.
+"""
+import atexit
+import math
+import multiprocessing
+import threading
+from multiprocessing.pool import ThreadPool
+import numpy as np
+
+
+workers = multiprocessing.cpu_count()
+minBytes = 16 * 1024 ** 2
+tileBytes = 4 * 1024 ** 2
+
+_pool = None
+_poolSize = 0
+_lock = threading.Lock()
+
+
+def pool(count):
+    """The shared pool, recreated when the worker count changes."""
+    global _pool, _poolSize
+    with _lock:
+        if _pool is None or _poolSize != count:
+            if _pool is not None:
+                _pool.close()
+            _pool = ThreadPool(count)
+            _poolSize = count
+        return _pool
+
+
+@atexit.register
+def _shutdown():
+    # idle pool threads otherwise fail noisily while the interpreter exits
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.close()
+            _pool.join()
+            _pool = None
+
+
+def forTiles(func, nx, rowBytes, chunkBytes=64 * 1024 ** 2, count=None):
+    """Call ``func(rows)`` for slices of rows covering ``[0, nx)``.
+
+    Each row holds `rowBytes` of input. Tiles are about `tileBytes` but at
+    least four per worker so they balance; serial work uses blocks of
+    `chunkBytes`.
+    """
+    count = workers if count is None else count
+    if count <= 1 or nx * rowBytes < minBytes:
+        step = max(1, int(chunkBytes // max(1, rowBytes)))
+        for i in xrange(0, nx, step):
+            func(slice(i, i + step))
+        return
+    step = max(1, min(int(tileBytes // max(1, rowBytes)), -(-nx // (4 * count))))
+    pool(count).map(func, [slice(i, i + step) for i in xrange(0, nx, step)])
+
+
+def sumFrames(data, start, end, dtype, chunkBytes=64 * 1024 ** 2, count=None):
+    """Sum of frames ``[start, end)`` of a (nx, ny, nt) cube in `dtype`."""
+    result = np.zeros(data.shape[:2], dtype=dtype)
+    if end <= start:
+        return result
+
+    def reduce(rows):
+        np.sum(data[rows, :, start:end], 2, dtype=dtype, out=result[rows])
+    forTiles(reduce, data.shape[0], data.shape[1] * (end - start) * data.dtype.itemsize, chunkBytes, count)
+    return result
+
+
+def multiply(plane, mask, count=None):
+    """``plane * mask`` for (nx, ny) arrays, into a preallocated output."""
+    result = np.empty(plane.shape, dtype=np.result_type(plane, mask))
+
+    def reduce(rows):
+        np.multiply(plane[rows], mask[rows], out=result[rows])
+    forTiles(reduce, plane.shape[0], plane[:1].nbytes + mask[:1].nbytes, count=count)
+    return result
+
+
+def maskedSum(data, mask, start, end, dtype, chunkBytes=64 * 1024 ** 2, count=None):
+    """Total of frames ``[start, end)`` weighted by the (nx, ny) `mask`."""
+    totals = []
+
+    def reduce(rows):
+        plane = np.sum(data[rows, :, start:end], 2, dtype=dtype)
+        totals.append(np.dot(plane.ravel(), np.asarray(mask[rows], dtype=np.float64).ravel()))
+    if end > start:
+        forTiles(reduce, data.shape[0], data.shape[1] * (end - start) * data.dtype.itemsize, chunkBytes, count)
+    # fsum makes the total independent of the order tiles finish in
+    return math.fsum(totals)
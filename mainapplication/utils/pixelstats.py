@@ -0,0 +1,65 @@
+"""Per-pixel statistics planes of a time window, computed in one streaming pass."""
+import numpy as np
+import parallel
+from windowindex import accumulatorDtype
+
+
+STATISTICS = ('sum', 'mean', 'max', 'variance', 'firstHit')
+
+
+def windowStats(data, start, end, chunkBytes=64 * 1024 ** 2, workers=None):
+    """Statistics of every pixel of a (nx, ny, nt) cube over frames ``[start, end)``.
+
+    Returns a dict of (nx, ny) planes named by `STATISTICS`: the sum in the
+    accumulator dtype, the mean, the max, the population variance and the
+    first frame with a non-zero value, or -1 for pixels without one. Each
+    frame is read once. Frame-major cubes are read a block of frames at a
+    time and the moments of every block are merged with Chan's update, so
+    the variance stays accurate over long windows.
+    """
+    nx, ny = data.shape[:2]
+    result = {'sum': np.zeros((nx, ny), dtype=accumulatorDtype(data.dtype)),
+              'mean': np.zeros((nx, ny), dtype=np.float64),
+              'max': np.zeros((nx, ny), dtype=data.dtype.newbyteorder('=')),
+              'variance': np.zeros((nx, ny), dtype=np.float64),
+              'firstHit': np.full((nx, ny), -1, dtype=np.int64)}
+    if end <= start:
+        return result
+    # sized on the float64 temporaries rather than the input
+    cellBytes = max(8, data.dtype.itemsize)
+    if data.strides[2] > data.strides[0]:
+        frames = max(1, int(chunkBytes // max(1, nx * ny * cellBytes)))
+    else:
+        frames = end - start
+
+    for t0 in xrange(start, end, frames):
+        t1 = min(end, t0 + frames)
+        seen = t0 - start
+
+        def update(rows):
+            block = data[rows, :, t0:t1]
+            blockSum = np.sum(block, 2, dtype=result['sum'].dtype)
+            blockMean = blockSum / float(t1 - t0)
+            deviation = block - blockMean[:, :, np.newaxis]
+            deviation *= deviation
+            blockM2 = deviation.sum(2)
+            mean, m2 = result['mean'][rows], result['variance'][rows]
+            if seen:
+                delta = blockMean - mean
+                total = float(seen + t1 - t0)
+                mean += delta * ((t1 - t0) / total)
+                m2 += blockM2 + delta * delta * (seen * (t1 - t0) / total)
+                np.maximum(result['max'][rows], block.max(2), out=result['max'][rows])
+            else:
+                mean[...] = blockMean
+                m2[...] = blockM2
+                result['max'][rows] = block.max(2)
+            result['sum'][rows] += blockSum
+            hit = block != 0
+            first = result['firstHit'][rows]
+            new = (first < 0) & hit.any(2)
+            first[new] = hit.argmax(2)[new] + t0
+        parallel.forTiles(update, nx, ny * (t1 - t0) * cellBytes, chunkBytes, workers)
+
+    result['variance'] /= end - start
+    return result
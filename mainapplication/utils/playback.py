@@ -0,0 +1,141 @@
+import os
+import threading
+import numpy as np
+import cube
+
+
+def framesSum(data, start, end, chunkBytes=64 * 1024 ** 2):
+    """Sum of frames ``[start, end)`` of a dense or sparse cube."""
+    if isinstance(data, np.ndarray):
+        return cube.windowSum(data, start, end, chunkBytes)
+    return data.windowSum(start, end)
+
+
+def windowCount(nt, width, stride):
+    return max(0, (nt - width) // stride + 1)
+
+
+class SlidingWindow(object):
+    """Running sum of a fixed-width window moved along the time axis.
+
+    Moving by less than the width adds the frames entering the window and
+    subtracts the ones leaving it, so a step costs ``stride`` frames
+    whatever the width; longer jumps sum the new window from scratch.
+    """
+
+    def __init__(self, data, width, start=0, chunkBytes=64 * 1024 ** 2):
+        self.data = data
+        self.width = width
+        self.chunkBytes = chunkBytes
+        self.start = start
+        self.sum = framesSum(data, start, start + width, chunkBytes)
+
+    @property
+    def end(self):
+        return self.start + self.width
+
+    def moveTo(self, start):
+        delta = start - self.start
+        if delta == 0:
+            return self.sum
+        if abs(delta) >= self.width:
+            self.sum = framesSum(self.data, start, start + self.width, self.chunkBytes)
+        elif delta > 0:
+            self.sum += framesSum(self.data, self.end, self.end + delta, self.chunkBytes)
+            self.sum -= framesSum(self.data, self.start, start, self.chunkBytes)
+        else:
+            self.sum += framesSum(self.data, start, self.start, self.chunkBytes)
+            self.sum -= framesSum(self.data, start + self.width, self.end, self.chunkBytes)
+        self.start = start
+        return self.sum
+
+    def step(self, stride):
+        return self.moveTo(self.start + stride)
+
+
+def exportWindows(data, fileName, width, stride=1, start=0, chunkBytes=64 * 1024 ** 2, onStep=None):
+    """Write the window sums of every step to an (nsteps, nx, ny) .npy file.
+
+    Steps are written one at a time into a memory-mapped output, so the
+    sequence never has to fit in memory. ``onStep(done)`` is called after
+    every step; if it raises, the partial file is removed. Returns the
+    number of steps.
+    """
+    count = windowCount(data.shape[2] - start, width, stride)
+    window = SlidingWindow(data, width, start, chunkBytes)
+    output = np.lib.format.open_memmap(fileName, mode='w+', dtype=window.sum.dtype,
+                                       shape=(count,) + tuple(data.shape[:2]))
+    try:
+        for i in xrange(count):
+            if i:
+                window.step(stride)
+            output[i] = window.sum
+            if onStep is not None:
+                onStep(i + 1)
+        output.flush()
+    except Exception:
+        del output
+        os.remove(fileName)
+        raise
+    del output
+    return count
+
+
+class WindowExport(object):
+    """Runs `exportWindows` on a background thread.
+
+    Like ``progressive.ProgressiveLoad`` it is polled for `progress` and
+    `done`; `cancel` stops it and removes the partial file.
+    """
+
+    def __init__(self, data, fileName, width, stride=1, start=0, chunkBytes=64 * 1024 ** 2):
+        self.fileName = fileName
+        self.count = windowCount(data.shape[2] - start, width, stride)
+        # steps written so far
+        self.steps = 0
+        self.result = None
+        self.error = None
+        self._cancelled = threading.Event()
+        self._finished = threading.Event()
+        self._thread = threading.Thread(target=self._export, args=(data, fileName, width, stride, start, chunkBytes))
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def progress(self):
+        return self.steps / float(max(1, self.count))
+
+    @property
+    def done(self):
+        return self._finished.is_set()
+
+    def _step(self, done):
+        if self._cancelled.is_set():
+            raise _Cancelled()
+        self.steps = done
+
+    def _export(self, *args):
+        try:
+            self.result = exportWindows(*args, onStep=self._step)
+        except _Cancelled:
+            pass
+        except Exception as e:
+            self.error = e
+        finally:
+            self._finished.set()
+
+    def wait(self):
+        """Block until the export ends; return the number of steps or raise its error."""
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def cancel(self):
+        """Stop exporting and remove the partial file."""
+        self._cancelled.set()
+        self._thread.join()
+
+
+class _Cancelled(Exception):
+    pass
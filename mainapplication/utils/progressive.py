@@ -0,0 +1,169 @@
+import threading
+import numpy as np
+import cube
+from windowindex import accumulatorDtype
+
+
+class ProgressiveLoad(object):
+    """Reads a raw cube file into a preallocated array on a background thread.
+
+    The file is read with ``readinto`` a chunk at a time into a zeroed
+    array, so `partial` can be shown while it fills: pixel-major files fill
+    a pixel at a time, frame-major files a frame at a time. Native files are
+    read straight into the array; other byte orders go through a one-chunk
+    scratch buffer. With ``narrow=True`` the array starts in the narrowest
+    dtype and is promoted when a chunk holds wider values, so it ends in the
+    dtype ``cube.loadCube`` would pick and the file is read once; a
+    promotion briefly holds both arrays. `cancel` stops the reader and drops
+    the array.
+    """
+
+    def __init__(self, fileName, shape, dtype=np.uint32, byteorder='=', offset=0, layout='pixel',
+                 narrow=False, chunkBytes=64 * 1024 ** 2):
+        if layout not in cube.LAYOUTS:
+            raise ValueError('Wrong layout')
+        self.fileName = fileName
+        self.offset = offset
+        self.layout = layout
+        self.narrow = narrow
+        self.chunkBytes = chunkBytes
+        self.fileDtype = np.dtype(dtype).newbyteorder(byteorder)
+        self.shape = tuple(shape)
+        self.fileShape = self.shape if layout == 'pixel' else (shape[2], shape[0], shape[1])
+        self.total = int(np.prod(self.shape)) * self.fileDtype.itemsize
+        # cells read so far
+        self.items = 0
+        self._buffer = None
+        self.result = None
+        self.error = None
+        self._cancelled = threading.Event()
+        self._finished = threading.Event()
+        self._thread = threading.Thread(target=self._read)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def progress(self):
+        return self.items * self.fileDtype.itemsize / float(max(1, self.total))
+
+    @property
+    def done(self):
+        return self._finished.is_set()
+
+    def cube(self):
+        """(nx, ny, nt) view of the whole array; unread cells are zero."""
+        buffer = self._buffer
+        if buffer is None:
+            return None
+        if self.layout == 'frame':
+            return cube.fromFrames(buffer)
+        return buffer[...]
+
+    def partial(self):
+        """`PartialCube` of what has been read so far."""
+        return PartialCube(self)
+
+    def _read(self):
+        try:
+            # only integer files get narrower
+            narrow = self.narrow and self.fileDtype.kind in 'ui'
+            dtype = cube.narrowDtype(0, 0, self.fileDtype) if narrow else self.fileDtype.newbyteorder('=')
+            self._buffer = np.zeros(self.fileShape, dtype=dtype)
+            size = self._buffer.size
+            direct = not narrow and dtype == self.fileDtype
+            step = max(1, self.chunkBytes // self.fileDtype.itemsize)
+            scratch = None if direct else np.empty(min(step, size), dtype=self.fileDtype)
+            low = high = 0
+            with open(self.fileName, 'rb') as dataFile:
+                dataFile.seek(self.offset)
+                for first in xrange(0, size, step):
+                    if self._cancelled.is_set():
+                        return
+                    target = self._buffer.reshape(-1)[first:first + step]
+                    chunk = target if direct else scratch[:len(target)]
+                    self._readFull(dataFile, chunk)
+                    if narrow:
+                        low, high = min(low, chunk.min()), max(high, chunk.max())
+                        dtype = cube.narrowDtype(low, high, self.fileDtype)
+                        if dtype != self._buffer.dtype:
+                            self._promote(dtype, first)
+                            target = self._buffer.reshape(-1)[first:first + step]
+                    if not direct:
+                        target[...] = chunk
+                    self.items = first + len(target)
+            self.result = self.cube()
+        except Exception as e:
+            self.error = e
+        finally:
+            self._finished.set()
+
+    def _promote(self, dtype, items):
+        """Move the first `items` cells read into a new array of `dtype`."""
+        buffer = np.zeros(self.fileShape, dtype=dtype)
+        buffer.reshape(-1)[:items] = self._buffer.reshape(-1)[:items]
+        self._buffer = buffer
+
+    def _readFull(self, dataFile, chunk):
+        view = chunk.view(np.uint8)
+        position = 0
+        while position < len(view):
+            read = dataFile.readinto(view[position:])
+            if not read:
+                raise IOError('%s ends before %d bytes' % (self.fileName, self.total))
+            position += read
+
+    def wait(self):
+        """Block until the cube is read; return it or raise the reading error."""
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def cancel(self):
+        """Stop reading and release the buffer."""
+        self._cancelled.set()
+        self._thread.join()
+        self._buffer = None
+        self.result = None
+
+
+class PartialCube(object):
+    """The part of a `ProgressiveLoad` read so far, with the sparse cube interface.
+
+    Window sums and light curves only touch the whole rows (pixel-major
+    files) or frames (frame-major files) already read; the rest of the cube
+    counts as zero.
+    """
+
+    def __init__(self, load):
+        self.shape = load.shape
+        self.chunkBytes = load.chunkBytes
+        buffer = load._buffer
+        self.dtype = load.fileDtype.newbyteorder('=') if buffer is None else buffer.dtype
+        self.nbytes = 0 if buffer is None else buffer.nbytes
+        nx, ny, nt = self.shape
+        items = load.items
+        if buffer is None:
+            self._data = None
+        elif load.layout == 'pixel':
+            self._data = buffer[:items // max(1, ny * nt)]
+        else:
+            self._data = cube.fromFrames(buffer[:items // max(1, nx * ny)])
+
+    def windowSum(self, start, end):
+        result = np.zeros(self.shape[:2], dtype=accumulatorDtype(self.dtype))
+        if self._data is not None:
+            nx, ny, nt = self._data.shape
+            result[:nx] = cube.windowSum(self._data, start, min(end, nt), self.chunkBytes)
+        return result
+
+    def lightCurves(self, masks):
+        masks = np.asarray(masks, dtype=np.float64)
+        single = masks.ndim == 2
+        if single:
+            masks = masks[np.newaxis]
+        result = np.zeros((len(masks), self.shape[2]), dtype=np.float64)
+        if self._data is not None:
+            nx, ny, nt = self._data.shape
+            result[:, :nt] = cube.lightCurves(self._data, masks[:, :nx], self.chunkBytes)
+        return result[0] if single else result
@@ -0,0 +1,278 @@
+"""Local query server sharing loaded cubes between viewers.
+
+Messages in both directions are a `FRAME` header (JSON length, payload
+length), a JSON object and an optional raw payload. Arrays travel as the
+payload with their dtype and shape in the JSON. When a request asks for
+``shm`` and the reply array is at least `shmBytes`, it is written to a
+file in /dev/shm instead and only the file name is sent; the server
+removes the file once the client sends its next request or disconnects.
+The socket gets the server's `mode` and shm files its read bits, so
+clients run by other users of that group can connect. Every reply carries
+the server-side ``latency`` in seconds.
+
+Requests name a run by its data file path and info values, so any number
+of clients share the one cube, index and window sums kept in the server's
+session cache.
+"""
+import json
+import os
+import SocketServer
+import socket
+import struct
+import tempfile
+import threading
+import time
+from collections import deque, OrderedDict
+import numpy as np
+import cube
+import mask
+import parallel
+import pixelstats
+import radial
+import session
+import windowindex
+
+
+FRAME = struct.Struct('<IQ')
+shmDirectory = '/dev/shm'
+shmBytes = 1024 ** 2
+
+
+def _receive(sock, count):
+    buffer = bytearray(count)
+    view = memoryview(buffer)
+    received = 0
+    while received < count:
+        n = sock.recv_into(view[received:], count - received)
+        if not n:
+            raise EOFError('Connection closed')
+        received += n
+    return buffer
+
+
+def removeShm(fileName):
+    """Remove a shm file written by `sendMessage`, if any."""
+    if fileName is not None:
+        try:
+            os.unlink(fileName)
+        except OSError:
+            pass
+
+
+def sendMessage(sock, meta, array=None, shm=False, mode=0o644):
+    """Send `meta` and `array`; return the shm file written, which the sender removes."""
+    payload = ''
+    if array is not None:
+        array = np.ascontiguousarray(array)
+        meta['dtype'] = array.dtype.str
+        meta['shape'] = list(array.shape)
+        if shm and array.nbytes >= shmBytes and os.path.isdir(shmDirectory):
+            handle, meta['shmFile'] = tempfile.mkstemp(prefix='neas-', dir=shmDirectory)
+            with os.fdopen(handle, 'wb') as shmFile:
+                os.fchmod(handle, mode & 0o444)
+                array.tofile(shmFile)
+        else:
+            payload = array.data
+    text = json.dumps(meta)
+    try:
+        sock.sendall(FRAME.pack(len(text), len(payload)) + text)
+        if len(payload):
+            sock.sendall(payload)
+    except Exception:
+        removeShm(meta.get('shmFile'))
+        raise
+    return meta.get('shmFile')
+
+
+def receiveMessage(sock):
+    """Return the JSON object of the next message and its array, if any."""
+    textLength, payloadLength = FRAME.unpack(str(_receive(sock, FRAME.size)))
+    meta = json.loads(str(_receive(sock, textLength)))
+    array = None
+    if 'shmFile' in meta:
+        array = np.fromfile(meta['shmFile'], dtype=str(meta['dtype']))
+    elif 'dtype' in meta:
+        array = np.frombuffer(_receive(sock, payloadLength), dtype=str(meta['dtype']))
+    if array is not None:
+        array = array.reshape(meta['shape'])
+    return meta, array
+
+
+class _Handler(SocketServer.BaseRequestHandler):
+    def handle(self):
+        shmFile = None
+        try:
+            while True:
+                try:
+                    request, array = receiveMessage(self.request)
+                except (EOFError, socket.error):
+                    return
+                # the client has read the previous reply
+                removeShm(shmFile)
+                shmFile = None
+                began = time.time()
+                try:
+                    reply, result = self.server.answer(request, array)
+                except Exception as e:
+                    reply, result = {'error': '%s: %s' % (type(e).__name__, e)}, None
+                reply['latency'] = time.time() - began
+                if 'error' not in reply:
+                    self.server.record(request['op'], reply['latency'])
+                shmFile = sendMessage(self.request, reply, result, request.get('shm', False), self.server.mode)
+        finally:
+            removeShm(shmFile)
+
+
+class QueryServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """Answers queries on a Unix socket; one thread per connected client."""
+    daemon_threads = True
+    OPS = ('info', 'windowSum', 'windowStats', 'maskedSum', 'profile', 'lightCurves', 'stats')
+
+    def __init__(self, address, maxBytes=4 * 1024 ** 3, indexMaxBytes=512 * 1024 ** 2, verbose=False,
+                 mode=0o660):
+        if os.path.exists(address):
+            os.unlink(address)
+        SocketServer.UnixStreamServer.__init__(self, address, _Handler)
+        # permissions of the socket; shm files get their read bits
+        self.mode = mode
+        os.chmod(address, mode)
+        self.session = session.SessionCache(maxBytes)
+        self.indexMaxBytes = indexMaxBytes
+        self.verbose = verbose
+        self.latencies = OrderedDict()
+        # the mask and radial bin caches are not thread-safe
+        self._lock = threading.Lock()
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+    def record(self, op, latency):
+        if op not in self.latencies:
+            self.latencies[op] = deque(maxlen=100)
+        self.latencies[op].append(latency)
+        if self.verbose:
+            print "%s %.2f ms" % (op, latency * 1000)
+
+    def answer(self, request, array):
+        op = request.get('op')
+        if op not in self.OPS:
+            raise ValueError('Unknown query: %s' % op)
+        return getattr(self, op)(request, array)
+
+    def run(self, request):
+        """Cube, index and cache key of the run named by `request`."""
+        info = request['infoFile']
+        shape = (info['nx'], info['ny'], info['nt'])
+        cubeFormat = cube.cubeFormat(info)
+        key = ('cube', session.fileKey(request['data']), shape, tuple(sorted(cubeFormat.items())))
+        data = self.session.get(key, lambda: cube.loadCube(request['data'], shape, narrow=True, **cubeFormat))
+        index = self.session.get(('index', key), lambda: windowindex.WindowIndex(data, maxBytes=self.indexMaxBytes))
+        return data, index, key
+
+    def plane(self, request):
+        data, index, key = self.run(request)
+        start, end = request['start'], request['end']
+        return self.session.get(('windowSum', key, start, end), lambda: index.windowSum(start, end))
+
+    def info(self, request, array):
+        data, index, key = self.run(request)
+        return {'cubeShape': list(data.shape), 'cubeDtype': data.dtype.str}, None
+
+    def windowSum(self, request, array):
+        return {}, self.plane(request)
+
+    def windowStats(self, request, array):
+        """One ``pixelstats.windowStats`` plane, named by ``request['statistic']``."""
+        data, index, key = self.run(request)
+        start, end = request['start'], request['end']
+        planes = self.session.get(('windowStats', key, start, end),
+                                  lambda: pixelstats.windowStats(data, start, end))
+        return {}, planes[request['statistic']]
+
+    def maskedSum(self, request, array):
+        plane = self.plane(request)
+        with self._lock:
+            ringMask = mask.ringMask(plane.shape, tuple(request['center']), tuple(request['radius']),
+                                     request.get('alghoritmIndex', 0))
+        return {'value': float(np.sum(parallel.multiply(plane, ringMask)))}, None
+
+    def profile(self, request, array):
+        plane = self.plane(request)
+        with self._lock:
+            bins = radial.radialBins(plane.shape, tuple(request['center']), request.get('antialias', False))
+        return {}, bins.profile(plane)
+
+    def lightCurves(self, request, masks):
+        data, index, key = self.run(request)
+        return {}, cube.lightCurves(data, masks)
+
+    def stats(self, request, array):
+        latencies = dict((op, sum(values) / len(values)) for op, values in list(self.latencies.items()))
+        return {'cache': self.session.summary(), 'latencies': latencies}, None
+
+
+class QueryError(Exception):
+    pass
+
+
+class QueryClient(object):
+    """Connection to a `QueryServer`; safe to share between threads."""
+
+    def __init__(self, address, shm=True):
+        self.address = address
+        self.shm = shm
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(address)
+        self._lock = threading.Lock()
+        self.latency = 0.
+        self.serverLatency = 0.
+
+    def close(self):
+        self.socket.close()
+
+    def query(self, op, array=None, **request):
+        request['op'] = op
+        request['shm'] = self.shm
+        began = time.time()
+        with self._lock:
+            sendMessage(self.socket, request, array)
+            reply, result = receiveMessage(self.socket)
+        self.latency = time.time() - began
+        self.serverLatency = reply['latency']
+        if 'error' in reply:
+            raise QueryError(reply['error'])
+        return reply, result
+
+
+class RemoteCube(object):
+    """Stand-in for a cube held by a query server, with the sparse cube interface."""
+
+    def __init__(self, client, dataName, infoFile):
+        self.client = client
+        self.run = {'data': os.path.abspath(dataName), 'infoFile': infoFile}
+        reply, result = client.query('info', **self.run)
+        self.shape = tuple(reply['cubeShape'])
+        self.dtype = np.dtype(str(reply['cubeDtype']))
+        self.nbytes = 0
+
+    def windowSum(self, start, end):
+        return self.client.query('windowSum', start=start, end=end, **self.run)[1]
+
+    def windowStats(self, start, end):
+        return dict((statistic, self.client.query('windowStats', statistic=statistic, start=start, end=end,
+                                                  **self.run)[1])
+                    for statistic in pixelstats.STATISTICS)
+
+    def maskedSum(self, center, radius, start, end, alghoritmIndex=0):
+        return self.client.query('maskedSum', center=center, radius=radius, start=start, end=end,
+                                 alghoritmIndex=alghoritmIndex, **self.run)[0]['value']
+
+    def profile(self, center, start, end, antialias=False):
+        return self.client.query('profile', center=center, start=start, end=end, antialias=antialias,
+                                 **self.run)[1]
+
+    def lightCurves(self, masks):
+        masks = np.asarray(masks, dtype=np.float64)
+        return self.client.query('lightCurves', masks, **self.run)[1]
@@ -0,0 +1,66 @@
+from collections import OrderedDict
+import numpy as np
+import instrument
+import mask
+
+
+cacheSize = 4
+_cache = OrderedDict()
+
+
+class RadialBins(object):
+    """Per-pixel radius bins of one geometry and center.
+
+    Bin ``k`` holds the pixels with ``k - 0.5 <= d < k + 0.5``, so summing
+    bins ``r0 .. r1 - 1`` gives the same total as the hard
+    ``mask.annulus`` for radii (r0, r1). With `antialias` every pixel is
+    split between its two neighbouring bins with linear weights, which is
+    the anti-aliased one pixel wide annulus of ``mask.annulus``.
+    """
+
+    def __init__(self, shape, center, antialias=False):
+        self.shape = tuple(shape)
+        self.center = tuple(center)
+        self.antialias = antialias
+        distance = mask.distanceGrid(shape, center).ravel()
+        if antialias:
+            lower = np.floor(distance)
+            self.fraction = distance - lower
+            self.index = lower.astype(np.intp)
+            self.count = self.index.max() + 2
+        else:
+            self.fraction = None
+            self.index = np.floor(distance + 0.5).astype(np.intp)
+            self.count = self.index.max() + 1
+        self.area = self.profile(np.ones(self.shape))
+
+    @property
+    def radii(self):
+        return np.arange(self.count)
+
+    def profile(self, plane):
+        """Sum of `plane` in every radius bin, in one pass over the pixels."""
+        values = np.asarray(plane, dtype=np.float64).ravel()
+        if self.fraction is None:
+            return np.bincount(self.index, values, self.count)
+        upper = values * self.fraction
+        return (np.bincount(self.index, values - upper, self.count) +
+                np.bincount(self.index + 1, upper, self.count))
+
+
+@instrument.timed('radialBins')
+def radialBins(shape, center, antialias=False):
+    """Cached `RadialBins`, keyed like ``mask.ringMask``."""
+    key = (tuple(shape), tuple(center), bool(antialias))
+    if key in _cache:
+        result = _cache.pop(key)
+    else:
+        result = RadialBins(shape, center, antialias)
+    _cache[key] = result
+    while len(_cache) > cacheSize:
+        _cache.popitem(last=False)
+    return result
+
+
+def clearCache():
+    _cache.clear()
@@ -0,0 +1,112 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+def fileKey(fileName):
+    """Identity of a file's current contents: path, size and modification time."""
+    stat = os.stat(fileName)
+    return os.path.realpath(fileName), stat.st_size, stat.st_mtime
+
+
+def sizeOf(value):
+    """Resident bytes of a cached value; memory-mapped arrays cost nothing.
+
+    Dicts, lists and tuples count the bytes of their items.
+    """
+    if isinstance(value, np.memmap):
+        return 0
+    if isinstance(value, dict):
+        return sum(sizeOf(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(sizeOf(item) for item in value)
+    return int(getattr(value, 'nbytes', 0))
+
+
+class SessionCache(object):
+    """LRU cache of cubes and their derived products under a byte budget.
+
+    Keys are tuples naming the product and everything it depends on, built
+    from `fileKey` and the parameters. Entries are evicted least recently
+    used first until the cached values fit in `maxBytes`; the newest entry
+    is always kept, even when it alone exceeds the budget. It may be used
+    from the GUI and worker threads at once.
+    """
+
+    def __init__(self, maxBytes=2 * 1024 ** 3):
+        self.maxBytes = maxBytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, compute):
+        """Cached value of `key`, calling ``compute()`` on a miss; None keys are never cached."""
+        if key is None:
+            return compute()
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                value, size = self._entries.pop(key)
+                self._entries[key] = (value, size)
+                return value
+            self.misses += 1
+        value = compute()
+        with self._lock:
+            if key not in self._entries:
+                size = sizeOf(value)
+                self._entries[key] = (value, size)
+                self.nbytes += size
+                self._evict(self.maxBytes)
+        return value
+
+    def put(self, key, value):
+        """Cache `value` under `key`, replacing any previous entry; returns `value`."""
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            size = sizeOf(value)
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            self._evict(self.maxBytes)
+        return value
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def touch(self, *keys):
+        """Mark `keys` as just used without counting a hit."""
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries[key] = self._entries.pop(key)
+
+    def _evict(self, maxBytes):
+        while len(self._entries) > 1 and self.nbytes > maxBytes:
+            key, (value, size) = self._entries.popitem(last=False)
+            self.nbytes -= size
+            self.evictions += 1
+
+    def setMaxBytes(self, maxBytes):
+        with self._lock:
+            self.maxBytes = maxBytes
+            self._evict(maxBytes)
+
+    def keys(self):
+        """Cached keys in eviction order, least recently used first."""
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def summary(self):
+        return 'cache %d items %.1f/%.0f MB, %d hits %d misses %d evicted' % (
+            len(self._entries), self.nbytes / 1024. ** 2, self.maxBytes / 1024. ** 2,
+            self.hits, self.misses, self.evictions)
@@ -0,0 +1,185 @@
+"""Sparse storage of low-occupancy cubes.
+
+A `SparseCube` keeps only the non-zero cells of a (nx, ny, nt) cube as
+events sorted by time: the flat pixel index and count of every event, and
+``frameStarts[t]``, the first event of frame ``t``. Window sums, masked
+sums and light curves then cost a pass over the events of the window
+instead of over every cell.
+"""
+import json
+import os
+import numpy as np
+import cube
+from windowindex import accumulatorDtype
+
+
+cacheSuffix = '.sparse.npz'
+
+
+def occupancy(data, sampleBytes=16 * 1024 ** 2):
+    """Fraction of non-zero cells, measured on evenly spaced rows of `data`."""
+    nx = data.shape[0]
+    rows = cube.chunkRows(data, data.shape[2], sampleBytes)
+    if rows >= nx:
+        sample = data
+    else:
+        sample = data[np.linspace(0, nx - 1, rows).astype(np.intp)]
+    if not sample.size:
+        return 0.
+    return np.count_nonzero(sample) / float(sample.size)
+
+
+class SparseCube(object):
+    def __init__(self, shape, pixels, counts, frameStarts):
+        self.shape = tuple(shape)
+        self.pixels = pixels
+        self.counts = counts
+        self.frameStarts = frameStarts
+        self.dtype = counts.dtype
+
+    @classmethod
+    def fromDense(cls, data, chunkBytes=64 * 1024 ** 2):
+        """Collect the non-zero cells of `data` a block of rows at a time."""
+        nx, ny, nt = data.shape
+        pixelType = np.int32 if nx * ny < 2 ** 31 else np.int64
+        pixels, times, counts = [], [], []
+        rows = cube.chunkRows(data, nt, chunkBytes)
+        for i in xrange(0, nx, rows):
+            block = np.asarray(data[i:i + rows])
+            x, y, t = np.nonzero(block)
+            counts.append(block[x, y, t])
+            pixels.append(((x + i) * ny + y).astype(pixelType))
+            times.append(t.astype(np.int32))
+        times = np.concatenate(times)
+        # a stable sort keeps the events of a frame in pixel order
+        order = np.argsort(times, kind='mergesort')
+        frameStarts = np.zeros(nt + 1, dtype=np.int64)
+        np.cumsum(np.bincount(times, minlength=nt), out=frameStarts[1:])
+        counts = np.concatenate(counts)[order]
+        counts = counts.astype(cube.narrowDtype(*cube.valueRange(counts), dtype=counts.dtype))
+        return cls(data.shape, np.concatenate(pixels)[order], counts, frameStarts)
+
+    @property
+    def nnz(self):
+        return len(self.counts)
+
+    @property
+    def occupancy(self):
+        return self.nnz / float(max(1, np.prod(self.shape)))
+
+    @property
+    def nbytes(self):
+        return self.pixels.nbytes + self.counts.nbytes + self.frameStarts.nbytes
+
+    def _events(self, start, end):
+        lo, hi = self.frameStarts[max(0, start)], self.frameStarts[min(end, self.shape[2])]
+        return self.pixels[lo:hi], self.counts[lo:hi]
+
+    def windowSum(self, start, end):
+        """Same as ``cube.windowSum`` on the dense cube."""
+        nx, ny = self.shape[:2]
+        if end <= start:
+            return np.zeros((nx, ny), dtype=accumulatorDtype(self.dtype))
+        pixels, counts = self._events(start, end)
+        result = np.bincount(pixels, counts, nx * ny)
+        return result.astype(accumulatorDtype(self.dtype)).reshape(nx, ny)
+
+    def windowStats(self, start, end):
+        """Same as ``pixelstats.windowStats`` on the dense cube.
+
+        Every statistic is taken over the events of the window; cells without
+        an event count as zero, so the mean and variance divide by the window
+        length.
+        """
+        nx, ny, nt = self.shape
+        start, end = max(0, start), min(end, nt)
+        size = nx * ny
+        result = {'sum': np.zeros(size, dtype=accumulatorDtype(self.dtype)),
+                  'mean': np.zeros(size, dtype=np.float64),
+                  'max': np.zeros(size, dtype=self.dtype.newbyteorder('=')),
+                  'variance': np.zeros(size, dtype=np.float64),
+                  'firstHit': np.full(size, -1, dtype=np.int64)}
+        if end > start:
+            pixels, counts = self._events(start, end)
+            length = float(end - start)
+            result['sum'][:] = np.bincount(pixels, counts, size)
+            result['mean'][:] = result['sum'] / length
+            squares = np.bincount(pixels, np.square(counts, dtype=np.float64), size)
+            result['variance'][:] = np.maximum(squares / length - result['mean'] ** 2, 0)
+            # pixels hit in every frame have no zero cell to start the max from
+            full = np.bincount(pixels, minlength=size) == end - start
+            if full.any():
+                result['max'][full] = counts.min()
+            np.maximum.at(result['max'], pixels, counts)
+            times = np.repeat(np.arange(start, end), np.diff(self.frameStarts[start:end + 1]))
+            first = np.full(size, end, dtype=np.int64)
+            np.minimum.at(first, pixels, times)
+            hit = first < end
+            result['firstHit'][hit] = first[hit]
+        return dict((name, plane.reshape(nx, ny)) for name, plane in result.items())
+
+    def maskedSum(self, mask, start, end):
+        """Total of frames ``[start, end)`` weighted by the (nx, ny) `mask`."""
+        pixels, counts = self._events(start, end)
+        return np.dot(np.asarray(mask, dtype=np.float64).ravel()[pixels], counts)
+
+    def lightCurves(self, masks):
+        """Same as ``cube.lightCurves`` on the dense cube."""
+        masks = np.asarray(masks, dtype=np.float64)
+        single = masks.ndim == 2
+        masks = masks.reshape(-1, self.shape[0] * self.shape[1])
+        nt = self.shape[2]
+        times = np.repeat(np.arange(nt), np.diff(self.frameStarts))
+        result = np.array([np.bincount(times, mask[self.pixels] * self.counts, nt) for mask in masks])
+        return result[0] if single else result
+
+    def toDense(self):
+        nx, ny, nt = self.shape
+        result = np.zeros((nx * ny, nt), dtype=self.dtype)
+        times = np.repeat(np.arange(nt), np.diff(self.frameStarts))
+        result[self.pixels, times] = self.counts
+        return result.reshape(nx, ny, nt)
+
+    def save(self, fileName, **source):
+        """Write the events as an .npz file; `source` identifies the raw file."""
+        with open(fileName, 'wb') as output:
+            np.savez(output, shape=np.array(self.shape), pixels=self.pixels, counts=self.counts,
+                     frameStarts=self.frameStarts, **source)
+
+    @classmethod
+    def load(cls, fileName):
+        with np.load(fileName) as stored:
+            return cls(stored['shape'], stored['pixels'], stored['counts'], stored['frameStarts'])
+
+
+def _source(dataName, cubeFormat):
+    stat = os.stat(dataName)
+    return {'size': np.array(stat.st_size), 'mtime': np.array(stat.st_mtime),
+            'format': np.array(json.dumps(sorted(cubeFormat.items())))}
+
+
+def saveCache(sparseCube, dataName, cubeFormat):
+    """Store `sparseCube` next to the raw file it was built from.
+
+    `cubeFormat` is the ``cube.cubeFormat`` the raw file was read with.
+    """
+    fileName = dataName + cacheSuffix
+    try:
+        sparseCube.save(fileName, **_source(dataName, cubeFormat))
+    except Exception:
+        if os.path.exists(fileName):
+            os.remove(fileName)
+        raise
+
+
+def loadCache(dataName, shape, cubeFormat):
+    """Sparse cube cached for `dataName` read as `cubeFormat`, or None when missing or stale."""
+    fileName = dataName + cacheSuffix
+    if not os.path.exists(fileName):
+        return None
+    source = _source(dataName, cubeFormat)
+    with np.load(fileName) as stored:
+        if tuple(stored['shape']) != tuple(shape) or \
+                any(key not in stored or stored[key] != value for key, value in source.items()):
+            return None
+    return SparseCube.load(fileName)
@@ -0,0 +1,27 @@
+import os
+import numpy as np
+
+
+def makeCube(nx, ny, nt, seed=0, occupancy=0.05, meanCount=3, dtype=np.uint32):
+    """Deterministic (nx, ny, nt) cube of Poisson counts in `occupancy` of the cells."""
+    random = np.random.RandomState(seed)
+    result = np.zeros((nx, ny, nt), dtype=dtype)
+    hits = random.random_sample((nx, ny, nt)) < occupancy
+    result[hits] = random.poisson(meanCount, hits.sum()) + 1
+    return result
+
+
+def writeRun(directory, name, data, layout='pixel', **info):
+    """Write `data` as a raw file plus a matching info file; return both paths."""
+    nx, ny, nt = data.shape
+    infoName = os.path.join(directory, name + '.info')
+    dataName = os.path.join(directory, name + '.dat')
+    values = [('nx', nx), ('ny', ny), ('nt', nt), ('dtype', data.dtype.name), ('layout', layout)]
+    values.extend(sorted(info.items()))
+    with open(infoName, 'w') as infoFile:
+        for key, value in values:
+            infoFile.write('%s = %s\n' % (key, value))
+    if layout == 'frame':
+        data = np.rollaxis(data, 2)
+    np.ascontiguousarray(data).tofile(dataName)
+    return infoName, dataName
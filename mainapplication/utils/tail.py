@@ -0,0 +1,48 @@
+import os
+import numpy as np
+from cube import fromFrames
+from windowindex import WindowIndex
+
+
+class CubeTail(object):
+    """Follows a frame-major data file that is still being written.
+
+    Every `poll` reads only the complete (nx, ny) frames appended since the
+    previous one into a growing frame buffer, and extends the window index
+    over them, so the cost of a poll is proportional to the new data.
+    """
+
+    def __init__(self, fileName, nx, ny, dtype=np.uint32, byteorder='=', offset=0, layout='frame',
+                 capacity=1, maxBytes=None):
+        if layout != 'frame':
+            raise ValueError('Only frame-major files can be followed')
+        self.fileName = fileName
+        self.offset = offset
+        self.dtype = np.dtype(dtype).newbyteorder(byteorder)
+        self.frameBytes = nx * ny * self.dtype.itemsize
+        self.nt = 0
+        self._frames = np.empty((max(1, capacity), nx, ny), dtype=self.dtype)
+        self._file = open(fileName, 'rb')
+        self.cube = fromFrames(self._frames[:0])
+        self.index = WindowIndex(self.cube, maxBytes=maxBytes)
+
+    def close(self):
+        self._file.close()
+
+    def poll(self):
+        """Read newly completed frames; return how many were added."""
+        available = (os.path.getsize(self.fileName) - self.offset) // self.frameBytes
+        added = available - self.nt
+        if added <= 0:
+            return 0
+        if available > len(self._frames):
+            frames = np.empty((max(available, 2 * len(self._frames)),) + self._frames.shape[1:],
+                              dtype=self.dtype)
+            frames[:self.nt] = self._frames[:self.nt]
+            self._frames = frames
+        self._file.seek(self.offset + self.nt * self.frameBytes)
+        read = self._file.readinto(self._frames[self.nt:available]) // self.frameBytes
+        self.nt += read
+        self.cube = fromFrames(self._frames[:self.nt])
+        self.index.extend(self.cube)
+        return read
@@ -1,4 +1,5 @@
 import draw
+import instrument
 import numpy as np
 
 
@@ -6,7 +7,11 @@ def num(s):
     try:
         return int(s)
     except ValueError:
+        pass
+    try:
         return float(s)
+    except ValueError:
+        return s.strip()
 
 
 def delimited(inputFile, delimiter='\n', bufsize=4096):
@@ -16,29 +21,41 @@ def delimited(inputFile, delimiter='\n', bufsize=4096):
             if not newbuf:
                 yield buf
                 return
+            # only the new bytes and a delimiter straddling the boundary need searching
+            start = max(0, len(buf) - len(delimiter) + 1)
             buf += newbuf
+            if buf.find(delimiter, start) < 0:
+                continue
             lines = buf.split(delimiter)
             for line in lines[:-1]:
                 yield line
             buf = lines[-1]
 
 
+def readInfoFile(fileName):
+    result = {}
+    with open(fileName, 'r') as infoFile:
+        for row in delimited(infoFile):
+            tmp = row.split('=')
+            if len(tmp) < 2:
+                continue
+            result[tmp[0].strip()] = num(tmp[1])
+    return result
+
+
+@instrument.timed('arrayRing')
 def arrayRing(size, center, radius, alghoritmIndex=0, delta=0.1):
     array = np.zeros(size)
+    radii = []
     tmp = radius[0]
+    while tmp < radius[1]:
+        radii.append(tmp)
+        tmp += delta
     if alghoritmIndex == 0:
-        while tmp < radius[1]:
-            x, y = draw.circle_perimeter(center[1], center[0], tmp, shape=size)
-            array[x, y] = 1
-            tmp += delta
+        draw.circle_perimeter_batch(center[1], center[0], radii, out=array)
         return array
 
     if alghoritmIndex == 1:
-        while tmp < radius[1]:
-            x, y, val = draw.circle_perimeter_aa(center[1], center[0], tmp, shape=size)
-            for x2,y2,val2 in zip(x,y,val):
-                if array[x2, y2] < val2:
-                    array[x2, y2] = val2
-            tmp += delta
+        draw.circle_perimeter_aa_batch(center[1], center[0], radii, out=array)
         return array
     return None
@@ -0,0 +1,109 @@
+import numpy as np
+import parallel
+
+
+def accumulatorDtype(dtype):
+    """Return a dtype wide enough to sum many values of `dtype` without overflow."""
+    dtype = np.dtype(dtype)
+    if dtype.kind in 'ub':
+        return np.dtype(np.uint64)
+    if dtype.kind == 'i':
+        return np.dtype(np.int64)
+    return np.dtype(np.float64)
+
+
+class WindowIndex(object):
+    """Prefix-sum index over the last (time) axis of a (nx, ny, nt) cube.
+
+    Checkpoint plane ``k`` holds the sum of frames ``[0, k*step)``, so a
+    window ``[start, end)`` costs two plane lookups and a subtraction plus at
+    most ``step/2`` frames summed on each side. With ``step=1`` the index is
+    a full cumulative cube; pass ``maxBytes`` to keep only as many checkpoint
+    planes as fit in that budget. `extend` follows a cube that grows along
+    the time axis, coarsening the checkpoints if the budget is exceeded.
+    """
+
+    def __init__(self, data, step=None, maxBytes=None, chunkBytes=64 * 1024 ** 2, workers=None):
+        nx, ny, nt = data.shape
+        self.data = data
+        self.dtype = accumulatorDtype(data.dtype)
+        self.maxBytes = maxBytes
+        self.planeBytes = nx * ny * self.dtype.itemsize
+        if step is None:
+            step = 1
+            if maxBytes is not None:
+                step = max(1, int(np.ceil((nt + 1) * self.planeBytes / float(maxBytes))))
+        self.step = int(step)
+        self.count = nt // self.step + 1
+        self._buffer = np.empty((self.count, nx, ny), dtype=self.dtype)
+        self.checkpoints = self._buffer
+        self.checkpoints[0] = 0
+
+        self.chunkBytes = chunkBytes
+        self.workers = workers
+
+        # cumulate a block of rows at a time so the temporary stays bounded
+        def cumulate(rows):
+            block = np.cumsum(data[rows], axis=2, dtype=self.dtype)
+            block = block[:, :, self.step - 1::self.step][:, :, :self.count - 1]
+            self.checkpoints[1:, rows] = np.rollaxis(block, 2)
+        parallel.forTiles(cumulate, nx, ny * nt * self.dtype.itemsize, chunkBytes, workers)
+
+    def extend(self, data):
+        """Follow `data`, a longer cube whose leading frames are the indexed ones.
+
+        Only the checkpoint planes of the new frames are summed.
+        """
+        nt = data.shape[2]
+        count = nt // self.step + 1
+        self.data = data
+        if count <= self.count:
+            return
+        if count > len(self._buffer):
+            capacity = 2 * len(self._buffer)
+            if self.maxBytes is not None:
+                capacity = min(capacity, self.maxBytes // self.planeBytes)
+            buffer = np.empty((max(count, capacity),) + data.shape[:2], dtype=self.dtype)
+            buffer[:self.count] = self._buffer[:self.count]
+            self._buffer = buffer
+        for k in xrange(self.count, count):
+            np.sum(data[:, :, (k - 1) * self.step:k * self.step], 2, dtype=self.dtype, out=self._buffer[k])
+            self._buffer[k] += self._buffer[k - 1]
+        self.count = count
+        while self.maxBytes is not None and self.count > 1 and self.count * self.planeBytes > self.maxBytes:
+            # checkpoint 2k of step s is checkpoint k of step 2s
+            kept = self._buffer[:self.count:2].copy()
+            self.step *= 2
+            self.count = len(kept)
+            self._buffer[:self.count] = kept
+        self.checkpoints = self._buffer[:self.count]
+
+    @property
+    def nbytes(self):
+        return self.checkpoints.nbytes
+
+    def prefix(self, t):
+        """Sum of frames ``[0, t)`` as an (nx, ny) plane."""
+        t = min(max(int(t), 0), self.data.shape[2])
+        i = t // self.step
+        rest = t - i * self.step
+        if rest == 0:
+            return self.checkpoints[i].copy()
+        upper = (i + 1) * self.step
+        if i + 1 < self.count and upper - t < rest:
+            return self.checkpoints[i + 1] - self._sum(t, upper)
+        return self.checkpoints[i] + self._sum(i * self.step, t)
+
+    def _sum(self, start, end):
+        return parallel.sumFrames(self.data, start, end, self.dtype, self.chunkBytes, self.workers)
+
+    def windowSum(self, start, end):
+        """Sum of frames ``[start, end)`` as an (nx, ny) plane."""
+        nt = self.data.shape[2]
+        start = min(max(int(start), 0), nt)
+        end = min(max(int(end), 0), nt)
+        if end <= start:
+            return np.zeros(self.data.shape[:2], dtype=self.dtype)
+        if end - start <= self.step:
+            return self._sum(start, end)
+        return self.prefix(end) - self.prefix(start)
@@ -1,10 +1,25 @@
+import functools
+import os
 import numpy as np
-import pyqtgraph.opengl as gl
-import pyqtgraph as pg
 from PyQt4 import QtGui, QtCore
 from mainapplication.utils import utils
-from qrangeslider import QRangeSlider
-import OpenGL.GL
+from mainapplication.utils import container
+from mainapplication.utils import cube
+from mainapplication.utils import dataflow
+from mainapplication.utils import instrument
+from mainapplication.utils import lod
+from mainapplication.utils import mask
+from mainapplication.utils import parallel
+from mainapplication.utils import pixelstats
+from mainapplication.utils import playback
+from mainapplication.utils import progressive
+from mainapplication.utils import query
+from mainapplication.utils import radial
+from mainapplication.utils import session
+from mainapplication.utils import sparse
+from mainapplication.utils import tail
+from mainapplication.utils import windowindex
+from mainapplication.windows import worker
 
 class MainWindow(QtGui.QMainWindow):
     def __init__(self):
@@ -16,36 +31,179 @@ class MainWindow(QtGui.QMainWindow):
         self.mainWidget = QtGui.QWidget()
         self.tabWidget = QtGui.QTabWidget()
 
-        self.arrayMask = None
+        self.maskRing = None
         self.maskIndex = 0
         self.infoFile = None
+        # info values of the file; infoFile describes the cube after binning
+        self.rawInfoFile = None
+        self.binning = (1, 1, 1)
+        self.currentRun = None
         self.dataFile = None
+        self.useWindowIndex = True
+        self.windowIndexMaxBytes = 512 * 1024 ** 2
+        self.chunkBytes = 64 * 1024 ** 2
+        self.useHeightBuffers = True
+        # cubes measured below this occupancy are kept as sparse events
+        self.sparseOccupancy = 0.1
+        # in-memory cubes are stored in the narrowest dtype holding their values
+        self.narrowDtypes = True
+        # per-pixel statistic of the window drawn as the surface height
+        self.statistic = 'sum'
+        # in-memory cubes are read on a background thread and shown while
+        # they fill; loaderKey is their session key once complete
+        self.progressiveLoading = True
+        self.loader = None
+        self.loaderKey = None
+        self.loaderShown = 0
+        # window sequence being exported on its own thread
+        self.exporter = None
+
+        # cubes, masks, indexes and window sums of every opened run, most
+        # recently used kept first; dataKey names the cube being shown
+        self.session = session.SessionCache(2 * 1024 ** 3)
+        self.dataKey = None
+        self.runs = []
+        self.maxRuns = 10
+        # set while data files are opened through a query server
+        self.queryClient = None
+        self.queryAddress = '/tmp/neas.sock'
+
+        self.timingsTimer = QtCore.QTimer(self)
+        self.timingsTimer.setInterval(500)
+        self.timingsTimer.timeout.connect(self.showTimings)
+
+        self.tail = None
+        self.followedFrames = 0
+        self.followTimer = QtCore.QTimer(self)
+        self.followTimer.setInterval(500)
+        self.followTimer.timeout.connect(self.followStep)
+
+        # while the slider or camera is dragged, surfaces are drawn from
+        # block-aggregated levels that fit in lodTriangleBudget
+        self.useLevelOfDetail = True
+        self.lodTriangleBudget = 500000
+        self.lodMethod = 'max'
+        self.interacting = False
+        self.pyramids = [None, None]
+        self.lodTimer = QtCore.QTimer(self)
+        self.lodTimer.setSingleShot(True)
+        self.lodTimer.setInterval(300)
+        self.lodTimer.timeout.connect(self.refineSurfaces)
+
+        self.worker = worker.ComputeWorker(self)
+        self.worker.resultReady.connect(self.showSurfaces)
+        self.worker.start()
+        QtGui.QApplication.instance().aboutToQuit.connect(self.worker.stop)
+        # coalesces bursts of slider events into one request
+        self.plotTimer = QtCore.QTimer(self)
+        self.plotTimer.setSingleShot(True)
+        self.plotTimer.setInterval(15)
+        self.plotTimer.timeout.connect(self.plotData)
 
         self.colorZero = [0., 0., 0.]
         self.colorCoeff = [0.01, 0.01,0.01]
         self.colorPow = [0.2, 1, 2]
         self.curMax = 100
 
+        # info/data/window/ring are set from the GUI through worker jobs and
+        # only evaluated on the worker; colors/colorMap stay on the GUI thread
+        self.graph = dataflow.Graph()
+        self.graph.add('info')
+        self.graph.add('data')
+        self.graph.add('window')
+        self.graph.add('ring')
+        self.graph.add('dataKey')
+        self.graph.add('statistic')
+        self.graph.add('index', self.makeWindowIndex, ['data', 'dataKey'])
+        self.graph.add('windowSum', self.computeWindowSum, ['data', 'index', 'window', 'dataKey'])
+        self.graph.add('mask', self.computeMask, ['info', 'ring'])
+        self.graph.add('height', self.computeHeight, ['data', 'windowSum', 'window', 'dataKey', 'statistic'])
+        self.graph.add('disc', parallel.multiply, ['height', 'mask'])
+        self.graph.add('bins', self.computeRadialBins, ['info', 'ring'])
+        self.graph.add('profile', lambda bins, windowSum: bins.profile(windowSum), ['bins', 'windowSum'])
+        self.graph.add('lightCurve', self.computeLightCurve, ['data', 'mask'])
+        self.graph.add('colors')
+        self.graph.add('colorMap', self.computeColorMap, ['colors'])
+        self.surfaceNodes = ['height', 'disc']
+
+        self.cacheLabel = QtGui.QLabel()
+        self.statusBar().addPermanentWidget(self.cacheLabel)
+        self.loadProgress = QtGui.QProgressBar()
+        self.loadProgress.setRange(0, 100)
+        self.loadProgress.setMaximumWidth(150)
+        self.loadProgress.hide()
+        self.statusBar().addPermanentWidget(self.loadProgress)
+        self.cancelLoadButton = QtGui.QPushButton('Cancel')
+        self.cancelLoadButton.clicked.connect(self.onCancelLoad)
+        self.cancelLoadButton.hide()
+        self.statusBar().addPermanentWidget(self.cancelLoadButton)
+        self.loadTimer = QtCore.QTimer(self)
+        self.loadTimer.setInterval(250)
+        self.loadTimer.timeout.connect(self.pollLoad)
+        self.exportProgress = QtGui.QProgressBar()
+        self.exportProgress.setRange(0, 100)
+        self.exportProgress.setMaximumWidth(150)
+        self.exportProgress.hide()
+        self.statusBar().addPermanentWidget(self.exportProgress)
+        self.cancelExportButton = QtGui.QPushButton('Cancel export')
+        self.cancelExportButton.clicked.connect(self.onCancelExport)
+        self.cancelExportButton.hide()
+        self.statusBar().addPermanentWidget(self.cancelExportButton)
+        self.exportTimer = QtCore.QTimer(self)
+        self.exportTimer.setInterval(250)
+        self.exportTimer.timeout.connect(self.pollExport)
+
         self.setCentralWidget(self.mainWidget)
         self.mainWidget.setLayout(QtGui.QGridLayout())
 
-        self.graphicWidgetGrid = gl.GLViewWidget()
-        self.graphicWidgetGrid.setCameraPosition(distance=50)
-        self.graphicWidgetGrid.setBackgroundColor('w')
-        self.graphicWidgetDisc = gl.GLViewWidget()
-        self.graphicWidgetDisc.setCameraPosition(distance=50)
-        self.graphicWidgetDisc.setBackgroundColor('w')
-
-        self.tabWidget.addTab(self.graphicWidgetGrid, 'Grid')
-        self.tabWidget.addTab(self.graphicWidgetDisc, 'Disc')
+        # GL views are created by glView when their tab first shows a
+        # surface, so PyOpenGL is not loaded before there is data
+        self.graphicWidgetGrid = None
+        self.graphicWidgetDisc = None
+        self.tabWidget.addTab(self.tabPage(), 'Grid')
+        self.tabWidget.addTab(self.tabPage(), 'Disc')
+        self.tabWidget.currentChanged.connect(lambda index: self.plotData())
         # self.mainWidget.layout().addWidget(self.graphicWidget1, 0, 0, 2, 1)
         self.mainWidget.layout().addWidget(self.tabWidget, 0, 0, 2, 1)
 
+        self.startPos = 0
+        self.endPos = 100
+        self.shownLightCurve = None
+        self.playTimer = QtCore.QTimer(self)
+        self.playTimer.timeout.connect(self.playStep)
+        # owned by the worker thread while playing
+        self.running = None
+        np.set_printoptions(precision=2)
+        # the panel needs pyqtgraph and qrangeslider; build it once the
+        # window and menus are on screen
+        QtCore.QTimer.singleShot(0, self._initControls_)
+
+        self.graph3DGrid = None
+        self.graph3DDisc = None
+
+    def _initControls_(self):
+        import pyqtgraph as pg
+        from qrangeslider import QRangeSlider
         self.matrixLabel = QtGui.QLabel('',self)
         self.rangeSlider = QRangeSlider(self.mainWidget)
         self.rangeSlider.setFixedHeight(30)
         self.mainWidget.layout().addWidget(self.rangeSlider, 2, 0)
 
+        # ring and detector totals of every time bin; the shaded region
+        # follows the range slider and moves it when dragged
+        self.lightCurvePlot = pg.PlotWidget()
+        self.lightCurvePlot.setLabel('bottom', 'time bin')
+        self.lightCurvePlot.setLabel('left', 'counts')
+        self.lightCurvePlot.addLegend()
+        self.lightCurves = [self.lightCurvePlot.plot(pen='r', name='ring'),
+                            self.lightCurvePlot.plot(pen='b', name='detector')]
+        self.lightCurveWindow = pg.LinearRegionItem()
+        self.lightCurveWindow.sigRegionChangeFinished.connect(self.onLightCurveWindowMoved)
+        self.lightCurvePlot.addItem(self.lightCurveWindow)
+        self.lightCurvePlot.setFixedHeight(150)
+        self.lightCurvePlot.hide()
+        self.mainWidget.layout().addWidget(self.lightCurvePlot, 3, 0, 1, 2)
+
         tmp = QtGui.QGridLayout()
         tmp.setAlignment(QtCore.Qt.AlignTop)
 
@@ -92,22 +250,47 @@ class MainWindow(QtGui.QMainWindow):
         self.combobox.addItem("With anti aliasing")
         self.combobox.activated[int].connect(self.onComboActivated)
         tmp.addWidget(self.combobox, 6, 0, 1, 3)
+
+        # play mode: slide the current window width by `stride` frames at
+        # `fps` steps per second
+        self.playButton = QtGui.QPushButton('Play')
+        self.playButton.setCheckable(True)
+        self.playButton.toggled.connect(self.onPlayToggled)
+        tmp.addWidget(self.playButton, 7, 0, 1, 3)
+        self.strideSpin = pg.SpinBox(value=1, int=True, step=1, bounds=(1, None))
+        self.strideSpin.setFixedWidth(60)
+        self.fpsSpin = pg.SpinBox(value=20, int=True, step=1, bounds=(1, 120))
+        self.fpsSpin.setFixedWidth(60)
+        self.fpsSpin.sigValueChanged.connect(self.onFpsChanged)
+        tmp.addWidget(QtGui.QLabel('stride', self), 8, 0)
+        tmp.addWidget(self.strideSpin, 8, 1)
+        tmp.addWidget(QtGui.QLabel('fps', self), 9, 0)
+        tmp.addWidget(self.fpsSpin, 9, 1)
+        self.statisticCombo = QtGui.QComboBox(self)
+        for name in ('Sum', 'Mean', 'Max', 'Variance', 'First hit'):
+            self.statisticCombo.addItem(name)
+        self.statisticCombo.activated[int].connect(self.onStatisticActivated)
+        tmp.addWidget(QtGui.QLabel('height', self), 10, 0)
+        tmp.addWidget(self.statisticCombo, 10, 1, 1, 2)
         # self.arrayMaskLabel = QtGui.QLabel("")
         # self.arrayMaskLabel.adjustSize()
         # self.arrayMaskLabel.setAlignment(QtCore.Qt.AlignTop)
-        np.set_printoptions(precision=2)
         # tmp.addWidget(self.arrayMaskLabel, 7, 0, 1, 3)
         self.onComboActivated(0)
         self.mainWidget.layout().addLayout(tmp, 0, 1)
 
-        self.startPos = 0
-        self.endPos = 100
+        # counts versus radius of the current window, all rings in one pass
+        self.profilePlot = pg.PlotWidget()
+        self.profilePlot.setLabel('bottom', 'radius')
+        self.profilePlot.setLabel('left', 'counts')
+        self.profileCurve = self.profilePlot.plot(stepMode=True)
+        self.profileRing = pg.LinearRegionItem(movable=False)
+        self.profilePlot.addItem(self.profileRing)
+        self.mainWidget.layout().addWidget(self.profilePlot, 1, 1)
+
         self.connect(self.rangeSlider, QtCore.SIGNAL('startValueChanged(int)'), self.setStart)
         self.connect(self.rangeSlider, QtCore.SIGNAL('endValueChanged(int)'), self.setEnd)
 
-        self.graph3DGrid = None
-        self.graph3DDisc = None
-
     def _initActions_(self):
         self.exitAction = QtGui.QAction(QtGui.QIcon('exit.png'),'&Exit',self)
         self.exitAction.setShortcut('Ctrl+Q')
@@ -122,58 +305,534 @@ class MainWindow(QtGui.QMainWindow):
         self.openDataFileMenu.setStatusTip('Open data file')
         self.openDataFileMenu.triggered.connect(self.loadDataFileAction)
 
+        self.openContainerMenu = QtGui.QAction(QtGui.QIcon('open.png'), 'Open container file', self)
+        self.openContainerMenu.setStatusTip('Open a run stored as a single container file')
+        self.openContainerMenu.triggered.connect(self.loadContainerAction)
+
+        self.memoryMapAction = QtGui.QAction('Memory-map data files', self)
+        self.memoryMapAction.setStatusTip('Map data files instead of reading them into memory')
+        self.memoryMapAction.setCheckable(True)
+
+        self.sparseAction = QtGui.QAction('Sparse storage for low occupancy', self)
+        self.sparseAction.setStatusTip('Keep mostly empty cubes as non-zero events, cached next to the data file')
+        self.sparseAction.setCheckable(True)
+        self.sparseAction.setChecked(True)
+
+        self.binningAction = QtGui.QAction('Binning...', self)
+        self.binningAction.setStatusTip('Sum blocks of pixels and time bins when data files are read')
+        self.binningAction.triggered.connect(self.setBinningAction)
+
+        self.followAction = QtGui.QAction('Follow data file', self)
+        self.followAction.setStatusTip('Keep reading frames appended to a frame-major data file')
+        self.followAction.setCheckable(True)
+        self.followAction.toggled.connect(self.onFollowToggled)
+
+        self.showTimingsAction = QtGui.QAction('Show timings', self)
+        self.showTimingsAction.setStatusTip('Time every pipeline stage and show it in the status bar')
+        self.showTimingsAction.setCheckable(True)
+        self.showTimingsAction.toggled.connect(self.onShowTimingsToggled)
+
+        self.lightCurveAction = QtGui.QAction('Light curve', self)
+        self.lightCurveAction.setStatusTip('Plot the ring and detector totals of every time bin')
+        self.lightCurveAction.setCheckable(True)
+        self.lightCurveAction.toggled.connect(self.onLightCurveToggled)
+
+        self.cacheBudgetAction = QtGui.QAction('Session memory budget...', self)
+        self.cacheBudgetAction.setStatusTip('Memory kept for recently used runs and their window sums')
+        self.cacheBudgetAction.triggered.connect(self.setCacheBudget)
+
+        self.workersAction = QtGui.QAction('Worker threads...', self)
+        self.workersAction.setStatusTip('Threads reducing large window sums; 1 reduces on a single thread')
+        self.workersAction.triggered.connect(self.setWorkers)
+
+        self.connectServerAction = QtGui.QAction('Connect to query server...', self)
+        self.connectServerAction.setStatusTip('Open data files through a shared query server started with serve.py')
+        self.connectServerAction.triggered.connect(self.connectServer)
+
+        self.exportWindowsAction = QtGui.QAction('Export window sequence...', self)
+        self.exportWindowsAction.setStatusTip('Save the play mode window sums of the whole run as a .npy file')
+        self.exportWindowsAction.triggered.connect(self.exportWindows)
+
+        self.exportTraceAction = QtGui.QAction('Export trace...', self)
+        self.exportTraceAction.setStatusTip('Save recorded timings as a Chrome trace file')
+        self.exportTraceAction.triggered.connect(self.exportTrace)
+
     def _initMenuBar_(self):
         self._initActions_()
         menubar = self.menuBar()
         file_menu = menubar.addMenu('File')
         file_menu.addAction(self.openInfoFileMenu)
         file_menu.addAction(self.openDataFileMenu)
+        file_menu.addAction(self.openContainerMenu)
+        file_menu.addAction(self.memoryMapAction)
+        file_menu.addAction(self.sparseAction)
+        file_menu.addAction(self.binningAction)
+        file_menu.addAction(self.followAction)
         file_menu.addAction(self.exitAction)
+        self.runsMenu = menubar.addMenu('Runs')
+        tools_menu = menubar.addMenu('Tools')
+        tools_menu.addAction(self.lightCurveAction)
+        tools_menu.addAction(self.showTimingsAction)
+        tools_menu.addAction(self.cacheBudgetAction)
+        tools_menu.addAction(self.workersAction)
+        tools_menu.addAction(self.connectServerAction)
+        tools_menu.addAction(self.exportWindowsAction)
+        tools_menu.addAction(self.exportTraceAction)
 
     def loadDataFile(self):
         fileName = QtGui.QFileDialog.getOpenFileName(self.show(), 'Open file','')
 
         if not fileName:
             return
-        dataFile = open(fileName, 'rb')
-        result = np.fromfile(dataFile, dtype=np.uint32)
-        # return result.reshape((self.infoFile['nt'], self.infoFile['nx'], self.infoFile['ny']))
-        return result.reshape((self.infoFile['nx'], self.infoFile['ny'], self.infoFile['nt']))
+        self.closeTail()
+        self.cancelLoad()
+        if self.followAction.isChecked():
+            self.updateBinning()
+            try:
+                self.tail = tail.CubeTail(str(fileName), self.infoFile['nx'], self.infoFile['ny'],
+                                          capacity=self.infoFile['nt'], maxBytes=self.windowIndexMaxBytes,
+                                          **cube.cubeFormat(self.infoFile))
+            except ValueError as e:
+                QtGui.QMessageBox.warning(self, 'Follow data file', '%s; set layout = frame in the info file' % e)
+                return None
+            self.tail.poll()
+            self.followedFrames = self.tail.nt
+            self.rangeSlider.setMax(self.tail.nt)
+            self.rangeSlider.setEnd(self.tail.nt)
+            self.dataKey = None
+            return self.tail.cube
+        return self.openDataFile(str(fileName))
+
+    def openDataFile(self, fileName):
+        self.cancelLoad()
+        self.updateBinning()
+        raw = self.rawInfoFile
+        shape = (raw['nx'], raw['ny'], raw['nt'])
+        cubeFormat = tuple(sorted(cube.cubeFormat(raw).items()))
+        if self.queryClient is not None:
+            self.dataKey = ('remote', self.queryClient.address, session.fileKey(fileName), shape, cubeFormat)
+            result = self.session.get(self.dataKey, lambda: query.RemoteCube(self.queryClient, fileName, raw))
+            self.rememberRun('data', fileName, raw)
+            return result
+        self.dataKey = ('cube', session.fileKey(fileName), shape, cubeFormat, self.infoFile['binning'],
+                        self.memoryMapAction.isChecked(), self.sparseAction.isChecked(), self.narrowDtypes)
+        self.rememberRun('data', fileName, raw)
+        if self.progressiveLoading and self.dataKey not in self.session:
+            result = self.readDataFile(fileName, shape, background=True)
+            if isinstance(result, progressive.ProgressiveLoad):
+                return self.startLoad(result)
+            return self.session.put(self.dataKey, result)
+        return self.session.get(self.dataKey, functools.partial(self.readDataFile, fileName, shape))
+
+    def readDataFile(self, fileName, shape, background=False):
+        mmap = self.memoryMapAction.isChecked()
+        binning = self.infoFile['binning']
+        if binning != (1, 1, 1):
+            # block sums straight from the mapped file
+            mapped = cube.loadCube(fileName, shape, mmap=True, **cube.cubeFormat(self.rawInfoFile))
+            result = cube.rebin(mapped, binning, self.chunkBytes)
+            if self.narrowDtypes:
+                result = cube.narrowCopy(result, self.chunkBytes)
+            return result
+        if self.sparseAction.isChecked():
+            cubeFormat = cube.cubeFormat(self.infoFile)
+            cached = sparse.loadCache(fileName, shape, cubeFormat)
+            if cached is not None:
+                return cached
+            # measure on the mapped file before deciding what to read
+            mapped = cube.loadCube(fileName, shape, mmap=True, **cubeFormat)
+            if sparse.occupancy(mapped) < self.sparseOccupancy:
+                result = sparse.SparseCube.fromDense(mapped, self.chunkBytes)
+                try:
+                    sparse.saveCache(result, fileName, cubeFormat)
+                except (IOError, OSError) as e:
+                    # read-only acquisition directories only lose the cache
+                    self.statusBar().showMessage('Sparse events not cached: %s' % e)
+                return result
+            if mmap:
+                return mapped
+        if background and not mmap:
+            return progressive.ProgressiveLoad(fileName, shape, narrow=self.narrowDtypes, chunkBytes=self.chunkBytes,
+                                               **cube.cubeFormat(self.infoFile))
+        return cube.loadCube(fileName, shape, mmap=mmap, narrow=self.narrowDtypes, chunkBytes=self.chunkBytes,
+                             **cube.cubeFormat(self.infoFile))
 
+    def startLoad(self, loader):
+        """Show `loader`'s cube while it fills; it is cached once complete."""
+        self.loader = loader
+        self.loaderKey = self.dataKey
+        # partial cubes are never cached nor indexed
+        self.dataKey = None
+        self.loadProgress.setValue(0)
+        self.loadProgress.show()
+        self.cancelLoadButton.show()
+        self.loadTimer.start()
+        self.statusBar().showMessage('Reading %s' % loader.fileName)
+        return loader.partial()
+
+    def pollLoad(self):
+        loader = self.loader
+        self.loadProgress.setValue(int(100 * loader.progress))
+        if loader.done:
+            self.finishLoad()
+        elif loader.items != self.loaderShown and not self.worker.busy():
+            # redraw from the data read so far
+            self.loaderShown = loader.items
+            self.dataFile = loader.partial()
+            self.plotData()
+
+    def finishLoad(self):
+        loader, key = self.loader, self.loaderKey
+        self.stopLoadTimer()
+        if loader.error is not None:
+            QtGui.QMessageBox.warning(self, 'Open data file', 'Cannot read %s: %s' % (loader.fileName, loader.error))
+            self.releaseData()
+            return
+        self.dataKey = key
+        self.dataFile = self.session.put(key, loader.result)
+        self.showMemorySaving(loader.fileDtype)
+        self.plotData()
+
+    def cancelLoad(self):
+        """Stop a progressive load; its partial cube is dropped."""
+        if self.loader is None:
+            return
+        self.loader.cancel()
+        self.stopLoadTimer()
+
+    def stopLoadTimer(self):
+        self.loadTimer.stop()
+        self.loader = None
+        self.loaderKey = None
+        self.loaderShown = 0
+        self.loadProgress.hide()
+        self.cancelLoadButton.hide()
+
+    def onCancelLoad(self):
+        fileName = self.loader.fileName if self.loader is not None else ''
+        self.cancelLoad()
+        self.releaseData()
+        self.statusBar().showMessage('Reading %s cancelled' % fileName)
+
+    def releaseData(self):
+        # the worker owns the graph and the running sum, which still refer
+        # to the partial cube
+        self.dataFile = None
+        self.worker.submit(self.clearGraphData)
+
+    def clearGraphData(self):
+        self.running = None
+        self.graph['data'].set(None)
+
+    @instrument.timed('loadData')
     def loadDataFileAction(self):
         self.dataFile = self.loadDataFile()
+        self.onFollowToggled(self.followAction.isChecked())
+        self.showMemorySaving(np.dtype(cube.cubeFormat(self.infoFile)['dtype']))
         self.plotData()
 
+    def activeBinning(self):
+        # followed files and served cubes are shown at full resolution
+        if self.followAction.isChecked() or self.queryClient is not None:
+            return (1, 1, 1)
+        return self.binning
+
+    def updateBinning(self):
+        if self.infoFile['binning'] != self.activeBinning():
+            self.setInfoFile(self.rawInfoFile)
+
+    def setBinningAction(self):
+        text, ok = QtGui.QInputDialog.getText(self, 'Binning', 'Pixels x, pixels y, time bins',
+                                              text=','.join(str(f) for f in self.binning))
+        if not ok:
+            return
+        try:
+            binning = tuple(int(f) for f in str(text).split(','))
+        except ValueError:
+            binning = ()
+        if len(binning) != 3 or min(binning) < 1:
+            QtGui.QMessageBox.warning(self, 'Binning', 'Give three positive factors, like 2,2,10')
+            return
+        self.setBinning(binning)
+
+    def setBinning(self, binning):
+        """Rebin the shown run, keeping the time window where it was."""
+        self.binning = binning
+        if self.rawInfoFile is None:
+            return
+        timeBin = self.infoFile['binning'][2]
+        window = (self.startPos * timeBin, self.endPos * timeBin)
+        if self.currentRun is not None and self.dataFile is not None and self.tail is None:
+            self.switchRun(self.currentRun)
+        else:
+            self.setInfoFile(self.rawInfoFile)
+        timeBin = self.infoFile['binning'][2]
+        self.rangeSlider.setRange(window[0] // timeBin, min(window[1] // timeBin, self.infoFile['nt']))
+
+    def rememberRun(self, kind, fileName, infoFile):
+        run = (kind, fileName, infoFile)
+        self.currentRun = run
+        self.runs = [run] + [other for other in self.runs if other[:2] != run[:2]][:self.maxRuns - 1]
+        self.runsMenu.clear()
+        for run in self.runs:
+            action = self.runsMenu.addAction(os.path.basename(run[1]))
+            action.setStatusTip(run[1])
+            action.triggered.connect(functools.partial(self.switchRun, run))
+
+    def switchRun(self, run, checked=False):
+        kind, fileName, infoFile = run
+        if kind == 'container':
+            self.openContainer(fileName)
+            return
+        self.closeTail()
+        self.setInfoFile(infoFile)
+        self.dataFile = self.openDataFile(fileName)
+        self.showMemorySaving(np.dtype(cube.cubeFormat(self.infoFile)['dtype']))
+        self.plotData()
+
+    def closeTail(self):
+        if self.tail is not None:
+            self.tail.close()
+            self.tail = None
+        self.followTimer.stop()
+
+    def setCacheBudget(self):
+        value, ok = QtGui.QInputDialog.getInt(self, 'Session memory budget', 'MB', self.session.maxBytes // 1024 ** 2, 0)
+        if ok:
+            self.session.setMaxBytes(value * 1024 ** 2)
+            self.showCacheStats()
+
+    def setWorkers(self):
+        value, ok = QtGui.QInputDialog.getInt(self, 'Worker threads', 'Threads', parallel.workers, 1, 256)
+        if ok:
+            parallel.workers = value
+            self.statusBar().showMessage('Window sums reduced on %d threads' % value)
+
+    def showCacheStats(self):
+        text = self.session.summary()
+        if self.queryClient is not None:
+            text += ' | query %.1f ms (server %.1f ms)' % (self.queryClient.latency * 1000,
+                                                         self.queryClient.serverLatency * 1000)
+        self.cacheLabel.setText(text)
+
+    def connectServer(self):
+        address, ok = QtGui.QInputDialog.getText(self, 'Query server', 'Socket (empty to disconnect)',
+                                                 text=self.queryAddress if self.queryClient is None else '')
+        if not ok:
+            return
+        if self.queryClient is not None:
+            self.queryClient.close()
+            self.queryClient = None
+        address = str(address)
+        if address:
+            try:
+                self.queryClient = query.QueryClient(address)
+            except Exception as e:
+                QtGui.QMessageBox.warning(self, 'Query server', 'Cannot connect to %s: %s' % (address, e))
+                return
+            self.queryAddress = address
+        self.statusBar().showMessage('Data files open through %s' % address if address else 'Data files open locally')
+
+    def showMemorySaving(self, fileDtype):
+        if self.dataFile is None or self.loader is not None:
+            return
+        raw = self.rawInfoFile
+        fileBytes = raw['nx'] * raw['ny'] * raw['nt'] * fileDtype.itemsize
+        if isinstance(self.dataFile, query.RemoteCube):
+            message = 'Data served from %s' % self.queryClient.address
+        elif isinstance(self.dataFile, np.memmap) or self.tail is not None:
+            message = 'Data mapped from file: %.1f MB' % (fileBytes / 1024. ** 2)
+        else:
+            message = 'Data stored as %s: %.1f MB instead of %.1f MB (%.0f%% saved)' % (
+                'sparse ' + self.dataFile.dtype.name if isinstance(self.dataFile, sparse.SparseCube)
+                else self.dataFile.dtype.name,
+                self.dataFile.nbytes / 1024. ** 2, fileBytes / 1024. ** 2,
+                100. * (1 - self.dataFile.nbytes / float(max(1, fileBytes))))
+        self.statusBar().showMessage(message)
+
+    def onFollowToggled(self, checked):
+        if checked and self.tail is not None:
+            self.followTimer.start()
+        else:
+            self.followTimer.stop()
+
+    def followStep(self):
+        if not self.worker.busy():
+            self.plotData()
+
+    def followFrames(self, nt):
+        atEnd = self.endPos >= self.followedFrames
+        self.followedFrames = nt
+        # playback and export read the frame count from the shown cube
+        self.dataFile = self.tail.cube
+        self.rangeSlider.setMax(nt)
+        if atEnd:
+            self.rangeSlider.setEnd(nt)
+
+    def makeWindowIndex(self, dataFile, dataKey):
+        followed = self.tail
+        if followed is not None and dataFile is followed.cube:
+            return followed.index
+        # cubes still being read are summed directly
+        if dataKey is None:
+            return None
+        # sparse and served cubes sum windows themselves
+        if not self.useWindowIndex or not isinstance(dataFile, np.ndarray):
+            return None
+        return self.session.get(dataKey and ('index', dataKey, self.windowIndexMaxBytes),
+                                functools.partial(self.buildWindowIndex, dataFile))
+
+    def buildWindowIndex(self, dataFile):
+        return windowindex.WindowIndex(dataFile, maxBytes=self.windowIndexMaxBytes, chunkBytes=self.chunkBytes)
+
+    def computeWindowSum(self, dataFile, windowIndex, window, dataKey):
+        running = self.running
+        if running is not None and running.data is dataFile and (running.start, running.end) == window:
+            # the running sum is updated in place by the next step
+            return running.sum.copy()
+        # the shown cube and its index stay the most recently used products
+        self.session.touch(dataKey, ('index', dataKey, self.windowIndexMaxBytes))
+        return self.session.get(dataKey and ('windowSum', dataKey, window),
+                                functools.partial(self.sumWindow, dataFile, windowIndex, window))
+
+    def sumWindow(self, dataFile, windowIndex, window):
+        if windowIndex is not None:
+            return windowIndex.windowSum(*window)
+        if not isinstance(dataFile, np.ndarray):
+            return dataFile.windowSum(*window)
+        return cube.windowSum(dataFile, window[0], window[1], self.chunkBytes)
+
+    def computeHeight(self, dataFile, windowSum, window, dataKey, statistic):
+        # cubes still loading only provide window sums
+        if statistic == 'sum' or not (isinstance(dataFile, np.ndarray) or hasattr(dataFile, 'windowStats')):
+            return windowSum
+        if isinstance(dataFile, np.ndarray):
+            compute = lambda: pixelstats.windowStats(dataFile, window[0], window[1], self.chunkBytes)
+        else:
+            compute = lambda: dataFile.windowStats(window[0], window[1])
+        planes = self.session.get(dataKey and ('stats', dataKey, window), compute)
+        return planes[statistic]
+
+    def computeMask(self, infoFile, ring):
+        center, radius, maskIndex = ring
+        shape = (infoFile['nx'], infoFile['ny'])
+        return self.session.get(('mask', shape, center, radius, maskIndex),
+                                lambda: mask.ringMask(shape, center, radius, maskIndex))
+
+    def computeRadialBins(self, infoFile, ring):
+        center, radius, maskIndex = ring
+        return radial.radialBins((infoFile['nx'], infoFile['ny']), center, maskIndex == 1)
+
+    def computeLightCurve(self, dataFile, ringMask):
+        if not isinstance(dataFile, np.ndarray):
+            return dataFile.lightCurves([ringMask, np.ones(ringMask.shape)])
+        return cube.lightCurves(dataFile, [ringMask, np.ones(ringMask.shape)], self.chunkBytes)
+
+    def computeColorMap(self, colors):
+        return np.array([j for i in zip(*colors) for j in i])
+
+    @instrument.timed('plotData')
+    def evaluate(self, tab, sources, followed=None, lightCurve=False, playing=False):
+        # runs on the worker thread: apply the GUI state captured by plotData
+        # and pull only the surface shown in `tab`
+        if followed is not None:
+            followed.poll()
+            sources = [source for source in sources if source[0] != 'data'] + [('data', followed.cube)]
+        for name, value in sources:
+            self.graph[name].set(value)
+        if playing:
+            self.moveRunningSum(self.graph['data'].value, self.graph['window'].value)
+        else:
+            self.running = None
+        return (tab, self.graph[self.surfaceNodes[tab]].get(), self.graph['data'].value.shape[2],
+                self.graph['profile'].get(), self.graph['lightCurve'].get() if lightCurve else None)
+
+    def moveRunningSum(self, dataFile, window):
+        running = self.running
+        start, end = window
+        if running is None or running.data is not dataFile or running.width != end - start:
+            self.running = playback.SlidingWindow(dataFile, end - start, start, self.chunkBytes)
+        else:
+            running.moveTo(start)
+
+    def recomputeCounts(self):
+        return self.graph.counts()
+
     def loadInfoFile(self):
         fileName = QtGui.QFileDialog.getOpenFileName(self.show(), 'Open file', '')
         if not fileName:
             return
-        infoFile = open(fileName, 'r')
-        result = {}
-        with infoFile:
-            for row in utils.delimited(infoFile):
-                tmp = row.split('=')
-                if len(tmp) < 2:
-                    continue
-                result[tmp[0].strip()] = utils.num(tmp[1])
+        result = utils.readInfoFile(str(fileName))
         print "info values:", result
         return result
 
+    @instrument.timed('loadInfo')
     def loadInfoFileAction(self):
-        self.infoFile = self.loadInfoFile()
+        self.currentRun = None
+        self.setInfoFile(self.loadInfoFile())
+
+    def setInfoFile(self, infoFile):
+        self.rawInfoFile = infoFile
+        self.infoFile = cube.rebinInfo(infoFile, self.activeBinning())
         self.startPos = 0
         self.endPos = self.infoFile['nt']
         self.rangeSlider.setRange(0, self.infoFile['nt'])
         self.rangeSlider.setMin(0)
         self.rangeSlider.setMax(self.infoFile['nt'])
         self.rangeSlider.update()
-        self.arrayMask = utils.arrayRing((self.infoFile['nx'], self.infoFile['ny']),
-                                         (self.infoFile['nx']/2-1, self.infoFile['ny']/2-1),
-                                         (50, self.infoFile['nx'] / 2 - 1),
-                                         self.maskIndex
-                                         )
+        self.maskRing = self.binnedRing((self.rawInfoFile['nx']/2-1, self.rawInfoFile['ny']/2-1),
+                                        (50, self.rawInfoFile['nx'] / 2 - 1))
+
+    def binnedRing(self, center, radius):
+        """Ring given in file pixels, in pixels of the binned cube."""
+        fx, fy = self.infoFile['binning'][:2]
+        if (fx, fy) == (1, 1):
+            return center, radius
+        return (((center[0] + 0.5) / fx - 0.5, (center[1] + 0.5) / fy - 0.5),
+                (radius[0] / float(fx), radius[1] / float(fx)))
 
 
+    @instrument.timed('loadContainer')
+    def loadContainerAction(self):
+        fileName = QtGui.QFileDialog.getOpenFileName(self.show(), 'Open file', '')
+        if not fileName:
+            return
+        try:
+            self.openContainer(str(fileName))
+        except ValueError as e:
+            QtGui.QMessageBox.warning(self, 'Open container file', str(e))
+
+    def openContainer(self, fileName):
+        self.cancelLoad()
+        self.closeTail()
+        runFile = container.Container(fileName)
+        try:
+            self.setInfoFile(runFile.info())
+            self.dataKey = ('container', session.fileKey(fileName), self.infoFile['binning'], self.narrowDtypes)
+            self.dataFile = self.session.get(self.dataKey, functools.partial(self.readContainer, runFile))
+        finally:
+            runFile.close()
+        self.rememberRun('container', fileName, None)
+        self.showMemorySaving(runFile.dtype)
+        self.plotData()
+
+    def readContainer(self, runFile):
+        binning = self.infoFile['binning']
+        if binning == (1, 1, 1):
+            result = runFile.read()
+        else:
+            # rebin a slab of whole time bins at a time
+            nx, ny, nt = runFile.shape
+            result = np.zeros((self.infoFile['nx'], self.infoFile['ny'], self.infoFile['nt']),
+                              dtype=windowindex.accumulatorDtype(runFile.dtype))
+            bins = max(1, self.chunkBytes // (nx * ny * runFile.dtype.itemsize * binning[2]))
+            for i in xrange(0, result.shape[2], bins):
+                slab = runFile.read(t=slice(i * binning[2], min(i + bins, result.shape[2]) * binning[2]))
+                result[:, :, i:i + bins] = cube.rebin(slab, binning, self.chunkBytes)
+        if self.narrowDtypes:
+            result = cube.narrowCopy(result, self.chunkBytes)
+        return result
+
     def onComboActivated(self, index):
         # tmp = utils.arrayRing((6, 6), (2, 2), (1,2), index)
         # self.arrayMaskLabel.setText(' ' + str(tmp).translate(None, '[]'))
@@ -186,25 +845,227 @@ class MainWindow(QtGui.QMainWindow):
             #                              self.maskIndex
             #                              )
             # Uncomment code above and comment code below, for non-preview mode
-            self.arrayMask = utils.arrayRing((self.infoFile['nx'], self.infoFile['ny']),
-                             (self.infoFile['nx']/2-1, self.infoFile['ny']/2-1),
-                             (self.infoFile['nx'] / 2 - 1, self.infoFile['nx'] / 2 + 50),
-                             self.maskIndex
-                             )
+            self.maskRing = self.binnedRing((self.rawInfoFile['nx']/2-1, self.rawInfoFile['ny']/2-1),
+                                            (self.rawInfoFile['nx'] / 2 - 1, self.rawInfoFile['nx'] / 2 + 50))
 
             self.plotData()
 
     def plotData(self):
         if self.dataFile is None:
             return
-        # sliceSum = np.sum(self.dataFile[:][:][self.startPos:self.endPos], 0)
-        sliceSum = np.sum(self.dataFile[:,:,self.startPos:self.endPos], 2)
-        self.curMax = np.max(sliceSum)
+        self.plotTimer.stop()
+        sources = [('info', self.infoFile),
+                   ('data', self.dataFile),
+                   ('dataKey', self.dataKey),
+                   ('statistic', self.statistic),
+                   ('window', (self.startPos, self.endPos)),
+                   ('ring', self.maskRing + (self.maskIndex,))]
+        self.worker.submit(functools.partial(self.evaluate, self.tabWidget.currentIndex(), sources, self.tail,
+                                             self.lightCurveAction.isChecked(), self.playTimer.isActive()))
+
+    def onStatisticActivated(self, index):
+        self.statistic = pixelstats.STATISTICS[index]
+        if self.statistic != 'sum' and not (self.dataFile is None or isinstance(self.dataFile, np.ndarray) or
+                                            hasattr(self.dataFile, 'windowStats')):
+            self.statusBar().showMessage('Only window sums are available while the data is loading')
+        self.plotData()
+
+    def onPlayToggled(self, checked):
+        if checked and self.dataFile is not None:
+            self.onFpsChanged(self.fpsSpin)
+            self.playTimer.start()
+        else:
+            self.playTimer.stop()
+            self.playButton.setChecked(False)
+
+    def onFpsChanged(self, spinBox):
+        self.playTimer.setInterval(int(1000 / spinBox.value()))
+
+    def playStep(self):
+        if self.worker.busy():
+            # the previous frame is still being computed
+            return
+        width = self.endPos - self.startPos
+        start = self.startPos + int(self.strideSpin.value())
+        if width <= 0 or start + width > self.dataFile.shape[2]:
+            self.playButton.setChecked(False)
+            return
+        # move the slider without the interaction path: frames are drawn at full detail
+        self.rangeSlider.blockSignals(True)
+        self.rangeSlider.setRange(start, start + width)
+        self.rangeSlider.blockSignals(False)
+        self.startPos, self.endPos = start, start + width
+        self.lightCurveWindow.setRegion((self.startPos, self.endPos))
+        self.plotData()
+
+    def exportWindows(self):
+        if self.dataFile is None or self.exporter is not None:
+            return
+        fileName = QtGui.QFileDialog.getSaveFileName(self, 'Export window sequence', 'windows.npy')
+        if not fileName:
+            return
+        self.exporter = playback.WindowExport(self.dataFile, str(fileName), self.endPos - self.startPos,
+                                              int(self.strideSpin.value()), self.startPos, self.chunkBytes)
+        self.exportWindowsAction.setEnabled(False)
+        self.exportProgress.setValue(0)
+        self.exportProgress.show()
+        self.cancelExportButton.show()
+        self.exportTimer.start()
+        self.statusBar().showMessage('Exporting %s' % self.exporter.fileName)
+
+    def pollExport(self):
+        exporter = self.exporter
+        self.exportProgress.setValue(int(100 * exporter.progress))
+        if not exporter.done:
+            return
+        self.stopExportTimer()
+        if exporter.error is not None:
+            QtGui.QMessageBox.warning(self, 'Export window sequence',
+                                      'Cannot write %s: %s' % (exporter.fileName, exporter.error))
+        else:
+            self.statusBar().showMessage('Exported %d window sums' % exporter.result)
+
+    def cancelExport(self):
+        """Stop a running export; its partial file is removed."""
+        if self.exporter is None:
+            return
+        self.exporter.cancel()
+        self.stopExportTimer()
+
+    def stopExportTimer(self):
+        self.exportTimer.stop()
+        self.exporter = None
+        self.exportProgress.hide()
+        self.cancelExportButton.hide()
+        self.exportWindowsAction.setEnabled(True)
+
+    def onCancelExport(self):
+        fileName = self.exporter.fileName if self.exporter is not None else ''
+        self.cancelExport()
+        self.statusBar().showMessage('Exporting %s cancelled' % fileName)
+
+    @instrument.timed('upload')
+    def showSurfaces(self, result):
+        if result is None:
+            return
+        tab, surface, nt, profile, lightCurve = result
+        self.showCacheStats()
+        if self.tail is not None and nt != self.followedFrames:
+            self.followFrames(nt)
+        self.showProfile(profile)
+        if lightCurve is not None:
+            self.showLightCurve(lightCurve)
+        if self.pyramids[tab] is not None and self.pyramids[tab].level(1) is surface:
+            return
+        self.curMax = np.max(surface)
+        firstSurface = self.graph3DGrid is None and self.graph3DDisc is None
+        self.pyramids[tab] = lod.SurfacePyramid(surface, self.lodMethod)
+        self.displaySurface(tab)
+        if firstSurface:
+            self.changeRedCoeff(self.colorCoeffSpin[0])
+            self.changeGreenCoeff(self.colorCoeffSpin[1])
+            self.changeBlueCoeff(self.colorCoeffSpin[2])
+
+        # self.graph3D.shader()['colorMap'] = np.array([0.001, 2, 0.5, 0.001, 0.7, 0.5, 0, 0, 1])
+        self.updateGraph3DColor()
+        # print "Plotted"
+
+    def showProfile(self, profile):
+        # bin k is centered on radius k
+        self.profileCurve.setData(np.arange(len(profile) + 1) - 0.5, profile)
+        if self.maskRing is not None:
+            radius = self.maskRing[1]
+            self.profileRing.setRegion((radius[0] - 0.5, radius[1] - 0.5))
+
+    def showLightCurve(self, lightCurve):
+        if lightCurve is self.shownLightCurve:
+            return
+        self.shownLightCurve = lightCurve
+        for curve, values in zip(self.lightCurves, lightCurve):
+            curve.setData(values)
+        self.lightCurveWindow.setRegion((self.startPos, self.endPos))
+
+    def onLightCurveToggled(self, checked):
+        self.lightCurvePlot.setVisible(checked)
+        if checked:
+            self.plotData()
+
+    def onLightCurveWindowMoved(self):
+        start, end = [int(round(x)) for x in self.lightCurveWindow.getRegion()]
+        if (start, end) != (self.startPos, self.endPos):
+            self.rangeSlider.setRange(max(0, start), min(end, self.rangeSlider.max()))
+
+    def displaySurface(self, tab):
+        pyramid = self.pyramids[tab]
+        if pyramid is None:
+            return
+        spacing = 1
+        z = pyramid.level(1)
+        if self.interacting and self.useLevelOfDetail:
+            spacing, z = pyramid.forBudget(self.lodTriangleBudget)
+        if tab == 0:
+            self.showGridSurface(z, spacing)
+        else:
+            self.showDiscSurface(z, spacing)
+
+    def startInteraction(self):
+        self.lodTimer.start()
+        if not self.interacting:
+            self.interacting = True
+            self.displaySurface(self.tabWidget.currentIndex())
+
+    def refineSurfaces(self):
+        self.interacting = False
+        self.displaySurface(self.tabWidget.currentIndex())
+
+    def eventFilter(self, obj, event):
+        if event.type() == QtCore.QEvent.Paint:
+            instrument.frame()
+        elif event.type() in (QtCore.QEvent.MouseButtonPress, QtCore.QEvent.Wheel) or \
+                (event.type() == QtCore.QEvent.MouseMove and event.buttons()):
+            self.startInteraction()
+        return QtGui.QMainWindow.eventFilter(self, obj, event)
+
+    def tabPage(self):
+        page = QtGui.QWidget()
+        page.setLayout(QtGui.QVBoxLayout())
+        page.layout().setContentsMargins(0, 0, 0, 0)
+        return page
+
+    def glView(self, tab):
+        name = ('graphicWidgetGrid', 'graphicWidgetDisc')[tab]
+        view = getattr(self, name)
+        if view is None:
+            import pyqtgraph.opengl as gl
+            view = gl.GLViewWidget()
+            view.setCameraPosition(distance=50)
+            view.setBackgroundColor('w')
+            view.installEventFilter(self)
+            self.tabWidget.widget(tab).layout().addWidget(view)
+            setattr(self, name, view)
+        return view
+
+    def surfaceItem(self, z, spacing=1):
+        if self.useHeightBuffers:
+            from mainapplication.windows import surface
+            return surface.HeightSurfaceItem(z=z, spacing=spacing, shader='heightColor')
+        import pyqtgraph.opengl as gl
+        item = gl.GLSurfacePlotItem(shader='heightColor', computeNormals=False, smooth=False)
+        self.setSurfaceData(item, z, spacing)
+        return item
+
+    def setSurfaceData(self, item, z, spacing=1):
+        if self.useHeightBuffers:
+            item.setData(z=z, spacing=spacing)
+        else:
+            item.setData(x=np.arange(z.shape[0]) * spacing, y=np.arange(z.shape[1]) * spacing, z=z)
+
+    def showGridSurface(self, sliceSum, spacing=1):
         if self.graph3DGrid is None:
             # x = np.linspace(0,self.infoFile['nx'],self.infoFile['nx'])
             # y = np.linspace(0,self.infoFile['ny'],self.infoFile['ny'])
             # self.graph3D  = gl.GLSurfacePlotItem(z=sliceSum, shader='shaded', computeNormals=False, smooth=False, glOptions='opaque')
-            self.graph3DGrid = gl.GLSurfacePlotItem(z=sliceSum, shader='heightColor', computeNormals=False, smooth=False)
+            self.graph3DGrid = self.surfaceItem(sliceSum, spacing)
             # self.graph3D.scale(16./49., 16./49., 1.0)
             # self.graph3D.translate(self.infoFile['nx']/2, self.infoFile['ny']/2, 3)
             #self.graph3D.rotate(-90, 0, 0, 0)
@@ -212,44 +1073,69 @@ class MainWindow(QtGui.QMainWindow):
             # self.graph3D.translate(-1000,-700,-700)
             # self.graph3D.shader()['colorMap'] = [1, 1, 1, 1, 0.5, 1, 1, 0, 1]
             # self.graph3D.shader()['colorMap'] = np.array([0.2, 2, 0.5, 0.2, 1, 1, 0.2, 0, 2])
-            self.graphicWidgetGrid.addItem(self.graph3DGrid)
+            self.glView(0).addItem(self.graph3DGrid)
             # self.setGraph3DColor([0.01, 0.2, 0.5, 0.01, 0.1, 1, 0.01, 0, 2])
             # self.setGraph3DColor([-0.001, 0.8, 0.5, -0.001, 0.9, 1, -0.001, 1, 2])
         else:
-            self.graph3DGrid.setData(z=sliceSum)
+            self.setSurfaceData(self.graph3DGrid, sliceSum, spacing)
 
+    def showDiscSurface(self, discSum, spacing=1):
         if self.graph3DDisc is None:
-            self.graph3DDisc = gl.GLSurfacePlotItem(z=sliceSum*self.arrayMask, shader='heightColor', computeNormals=False, smooth=False)
+            self.graph3DDisc = self.surfaceItem(discSum, spacing)
             self.graph3DDisc.translate(-18, 2, 0)
-            self.graphicWidgetDisc.addItem(self.graph3DDisc)
-            self.changeRedCoeff(self.colorCoeffSpin[0])
-            self.changeGreenCoeff(self.colorCoeffSpin[1])
-            self.changeBlueCoeff(self.colorCoeffSpin[2])
+            self.glView(1).addItem(self.graph3DDisc)
         else:
-            self.graph3DDisc.setData(z=sliceSum*self.arrayMask)
-
-        # self.graph3D.shader()['colorMap'] = np.array([0.001, 2, 0.5, 0.001, 0.7, 0.5, 0, 0, 1])
-        self.updateGraph3DColor()
-        # print "Plotted"
+            self.setSurfaceData(self.graph3DDisc, discSum, spacing)
 
+    @instrument.timed('updateColor')
     def updateGraph3DColor(self):
         # self.graph3DGrid.shader()['colorMap'] = np.array(color)
-        if self.graph3DGrid is None:
-            return
-        # print [j for i in zip(self.colorCoeff,self.colorZero,self.colorPow) for j in i]
-        self.graph3DGrid.shader()['colorMap'] = np.array([j for i in zip(self.colorCoeff,self.colorZero,self.colorPow) for j in i])
-        self.graph3DGrid.update()
-        self.graph3DDisc.update()
+        self.graph['colors'].set((tuple(self.colorCoeff), tuple(self.colorZero), tuple(self.colorPow)))
+        for graph3D in (self.graph3DGrid, self.graph3DDisc):
+            if graph3D is None:
+                continue
+            graph3D.shader()['colorMap'] = self.graph['colorMap'].get()
+            graph3D.update()
 
     def setStart(self, pos):
         if pos != self.startPos:
             self.startPos = pos
-            self.plotData()
+            self.lightCurveWindow.setRegion((self.startPos, self.endPos))
+            self.startInteraction()
+            self.plotTimer.start()
 
     def setEnd(self, pos):
         if pos != self.endPos:
             self.endPos = pos
-            self.plotData()
+            self.lightCurveWindow.setRegion((self.startPos, self.endPos))
+            self.startInteraction()
+            self.plotTimer.start()
+
+    def onShowTimingsToggled(self, checked):
+        instrument.enabled = checked
+        if checked:
+            instrument.reset()
+            self.timingsTimer.start()
+        else:
+            self.timingsTimer.stop()
+            self.statusBar().clearMessage()
+
+    def showTimings(self):
+        self.statusBar().showMessage(instrument.summary())
+
+    def exportTrace(self):
+        fileName = QtGui.QFileDialog.getSaveFileName(self, 'Export trace', 'trace.json')
+        if not fileName:
+            return
+        instrument.exportTrace(str(fileName))
+
+    def closeEvent(self, event):
+        self.cancelLoad()
+        self.cancelExport()
+        self.worker.stop()
+        if self.queryClient is not None:
+            self.queryClient.close()
+        QtGui.QMainWindow.closeEvent(self, event)
 
     def changeRedCoeff(self, spinBox):
         # self.colorCoeff[0] = value/100.
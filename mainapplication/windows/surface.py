@@ -0,0 +1,104 @@
+import numpy as np
+from OpenGL import GL
+from pyqtgraph.opengl import shaders
+from pyqtgraph.opengl.GLGraphicsItem import GLGraphicsItem
+from mainapplication.utils import instrument
+
+
+def gridFaces(rows, cols):
+    """Triangle indices of a rows x cols vertex grid, two per quad, like GLSurfacePlotItem."""
+    quads = (np.arange(rows - 1)[:, np.newaxis] * cols + np.arange(cols - 1)).ravel()
+    faces = np.empty((quads.size, 2, 3), dtype=np.uint32)
+    faces[:, 0] = quads[:, np.newaxis] + [0, 1, cols]
+    faces[:, 1] = quads[:, np.newaxis] + [cols, 1, cols + 1]
+    return faces.reshape(-1, 3)
+
+
+class HeightSurfaceItem(GLGraphicsItem):
+    """Surface over a fixed (x, y) grid whose heights change often.
+
+    Drop-in for ``GLSurfacePlotItem(z=..., shader=...)`` in the viewer.
+    The vertex and index buffers live on the GPU and are only recreated
+    when the grid shape changes; `setData(z=...)` just writes the heights
+    into the vertex array and streams it into the existing buffer with
+    glBufferSubData. Heights set between two frames are coalesced, so at
+    most one upload happens per paint. `spacing` is the distance between
+    grid vertices, used to draw block-aggregated levels over the same
+    extent as the full grid.
+    """
+
+    def __init__(self, z=None, spacing=1, shader='heightColor', glOptions='opaque', **kwds):
+        GLGraphicsItem.__init__(self)
+        self.setGLOptions(glOptions)
+        self._shader = shader
+        self._vertexes = None
+        self._spacing = 1
+        self._faces = None
+        self._pending = None
+        self._buffers = None
+        self._rebuild = False
+        if z is not None:
+            self.setData(z=z, spacing=spacing)
+
+    def shader(self):
+        return shaders.getShaderProgram(self._shader)
+
+    def setData(self, z=None, spacing=1):
+        if z is None:
+            return
+        z = np.asarray(z)
+        if self._vertexes is None or self._vertexes.shape[:2] != z.shape or self._spacing != spacing:
+            rows, cols = z.shape
+            self._spacing = spacing
+            self._vertexes = np.empty((rows, cols, 3), dtype=np.float32)
+            self._vertexes[..., 0] = np.arange(rows)[:, np.newaxis] * spacing
+            self._vertexes[..., 1] = np.arange(cols) * spacing
+            self._vertexes[..., 2] = z
+            self._faces = gridFaces(rows, cols)
+            self._rebuild = True
+            self._pending = None
+        elif self._rebuild:
+            # the buffers are recreated from the vertex array at the next paint
+            self._vertexes[..., 2] = z
+        else:
+            self._pending = z
+        self.update()
+
+    def _createBuffers(self):
+        if self._buffers is not None:
+            GL.glDeleteBuffers(2, self._buffers)
+        self._buffers = GL.glGenBuffers(2)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self._buffers[0])
+        GL.glBufferData(GL.GL_ARRAY_BUFFER, self._vertexes.nbytes, self._vertexes, GL.GL_DYNAMIC_DRAW)
+        GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, self._buffers[1])
+        GL.glBufferData(GL.GL_ELEMENT_ARRAY_BUFFER, self._faces.nbytes, self._faces, GL.GL_STATIC_DRAW)
+        self._rebuild = False
+
+    def _uploadHeights(self):
+        self._vertexes[..., 2] = self._pending
+        self._pending = None
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self._buffers[0])
+        GL.glBufferSubData(GL.GL_ARRAY_BUFFER, 0, self._vertexes.nbytes, self._vertexes)
+
+    @instrument.timed('paint')
+    def paint(self):
+        if self._vertexes is None:
+            return
+        self.setupGLState()
+        if self._rebuild:
+            self._createBuffers()
+        if self._pending is not None:
+            self._uploadHeights()
+
+        with self.shader():
+            GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
+            try:
+                GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self._buffers[0])
+                GL.glVertexPointer(3, GL.GL_FLOAT, 0, None)
+                GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, self._buffers[1])
+                GL.glColor4f(1., 1., 1., 1.)
+                GL.glDrawElements(GL.GL_TRIANGLES, self._faces.size, GL.GL_UNSIGNED_INT, None)
+            finally:
+                GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+                GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, 0)
+                GL.glDisableClientState(GL.GL_VERTEX_ARRAY)
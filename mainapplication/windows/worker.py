@@ -0,0 +1,65 @@
+import threading
+import traceback
+from PyQt4 import QtCore
+
+
+class ComputeWorker(QtCore.QThread):
+    """Runs the most recently submitted job off the GUI thread.
+
+    Submitting while a job is still queued replaces it, and a result whose
+    request was superseded while it was being computed is dropped instead of
+    being emitted. Results are delivered through `resultReady`, which Qt
+    queues onto the GUI thread. Timer-driven callers check `busy` and skip
+    a tick rather than superseding a job slower than their interval, which
+    would drop every result.
+    """
+    resultReady = QtCore.pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        QtCore.QThread.__init__(self, parent)
+        self._condition = threading.Condition()
+        self._job = None
+        self._generation = 0
+        self._running = True
+        self._computing = False
+
+    def submit(self, job):
+        with self._condition:
+            self._generation += 1
+            self._job = job
+            self._condition.notify()
+
+    def busy(self):
+        """True while a job is queued or being computed."""
+        with self._condition:
+            return self._job is not None or self._computing
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._job = None
+            self._condition.notify()
+        self.wait()
+
+    def run(self):
+        while True:
+            with self._condition:
+                while self._running and self._job is None:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                job, generation = self._job, self._generation
+                self._job = None
+                self._computing = True
+            try:
+                result = job()
+            except Exception:
+                traceback.print_exc()
+                continue
+            finally:
+                with self._condition:
+                    self._computing = False
+            with self._condition:
+                if generation != self._generation:
+                    continue
+            self.resultReady.emit(result)
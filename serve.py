@@ -0,0 +1,34 @@
+"""Run the local query server.
+
+    python serve.py --address /tmp/neas.sock --budget 4096
+
+Viewers connected with Tools > Connect to query server share the cubes,
+indexes and window sums it keeps, instead of each loading its own copy.
+"""
+import argparse
+import sys
+from mainapplication.utils import query
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve window sums, masked sums and profiles of loaded runs.')
+    parser.add_argument('--address', default='/tmp/neas.sock', help='Unix socket path')
+    parser.add_argument('--budget', type=int, default=4096, help='memory budget for cached runs in MB')
+    parser.add_argument('--mode', type=lambda text: int(text, 8), default=0o660,
+                        help='octal permissions of the socket, e.g. 666 to serve every user')
+    parser.add_argument('--verbose', action='store_true', help='print the latency of every query')
+    args = parser.parse_args(argv)
+
+    server = query.QueryServer(args.address, args.budget * 1024 ** 2, verbose=args.verbose, mode=args.mode)
+    print "serving on", args.address
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())